@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 import dj_database_url
@@ -105,6 +106,38 @@ if "DATABASE_URL" in os.environ:
     if "CI" in os.environ:
         DATABASES["default"]["TEST"] = DATABASES["default"]
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # ETags and bodies of GitHub API responses, which GitHub answers with 304s that do not count
+    # against the rate limit. It is kept in the database so that every process of every host, and
+    # the next deploy, share it. Its table is created by `createcachetable`.
+    "github": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "leaderboard_github_cache",
+    },
+}
+
+if "CACHE_DIR" in os.environ:
+    # Share the cache between the gunicorn workers of a dyno.
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ["CACHE_DIR"],
+    }
+
+# Pre-rendered leaderboard, memory-mapped by every worker process of a host. Each host keeps its own
+# file current by following the scores version in the database, so it does not need to be shared.
+LEADERBOARD_SNAPSHOT_PATH = os.environ.get(
+    "LEADERBOARD_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "leaderboard.snapshot"))
+
+# Seconds a process keeps using the scores version it read before reading it again. Cached responses
+# and 304s skip the database meanwhile, and bumps from other processes show up that much later.
+LEADERBOARD_VERSION_TTL = float(os.environ.get("LEADERBOARD_VERSION_TTL", 2))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
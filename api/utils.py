@@ -5,21 +5,32 @@ from rest_framework.exceptions import ParseError
 from rest_framework.parsers import JSONParser as DRFJSONParser
 from rest_framework.utils import json
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 
 class JSONParser(DRFJSONParser):
 
     def parse(self, stream, media_type=None, parser_context=None):
         """
-        Parses the incoming bytestream as JSON and returns the resulting data.
+        Parses the incoming bytestream as JSON and returns the resulting data. UTF-8 bodies, which
+        is what GitHub sends, are parsed as read, without decoding them to `str` first.
         """
         parser_context = parser_context or {}
         encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
         request = parser_context.get('request')
+        body = stream.read()
+        # setting original body to request as raw_body, as it can't be read again
+        setattr(request, 'raw_body', body)
         try:
-            decoded_stream_data = codecs.getreader(encoding)(stream).read()
-            # setting original body to request as raw_body, as it can't be read again
-            setattr(request, 'raw_body', decoded_stream_data)
+            if codecs.lookup(encoding).name != 'utf-8':
+                body = body.decode(encoding)
+            # orjson rejects NaN and Infinity, like strict parsing does
+            if orjson is not None and self.strict:
+                return orjson.loads(body)
             parse_constant = json.strict_constant if self.strict else None
-            return json.loads(decoded_stream_data, parse_constant=parse_constant)
+            return json.loads(body, parse_constant=parse_constant)
         except ValueError as exc:
             raise ParseError('JSON parse error - %s' % str(exc))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import GithubUser, Label, Repository, Issue, PullRequest
+from .models import GithubUser, Label, Repository, Issue, PullRequest, ContributorScore, WebhookDelivery
 
 
 @admin.register(GithubUser)
@@ -15,8 +15,19 @@ class GithubUserAdmin(admin.ModelAdmin):
 @admin.register(Label)
 class LabelAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'points')
+    list_editable = ('points',)
     search_fields = ('name',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        delivery = getattr(obj, 'rescore_delivery', None)
+        if delivery is not None:
+            self.message_user(
+                request,
+                f'The contributors of {obj.name} will be rescored by the webhook worker, '
+                f'as webhook delivery {delivery.pk}.',
+            )
+
 
 @admin.register(Repository)
 class RepositoryAdmin(admin.ModelAdmin):
@@ -47,3 +58,23 @@ class PullRequestAdmin(admin.ModelAdmin):
 
     def has_add_permission(self, request):
         return False
+
+
+@admin.register(ContributorScore)
+class ContributorScoreAdmin(admin.ModelAdmin):
+    list_display = ('user', 'issue_points', 'pull_request_points', 'total', 'last_updated')
+    search_fields = ('user__id', 'user__username')
+    ordering = ('-total',)
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event', 'action', 'entity', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event')
+    search_fields = ('delivery_id', 'entity')
+
+    def has_add_permission(self, request):
+        return False
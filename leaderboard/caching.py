@@ -0,0 +1,79 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Version
+
+LEADERBOARD_VERSION_KEY = 'leaderboard:version'
+LABELS_VERSION_KEY = 'leaderboard:labels:version'
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# versions this process read, by key, with the monotonic time they were read at
+_versions: 'dict[str, tuple[int, float]]' = {}
+
+
+def get_version(key: str = LEADERBOARD_VERSION_KEY) -> int:
+    """
+    Returns the version of the scores, which changes whenever a webhook writes contributions, or
+    the version stored under another `key`.
+    """
+    version = Version.objects.filter(key=key).values_list('value', flat=True).first()
+    if version is None:
+        # counters start from the time, so that one created again never repeats a version processes saw
+        version = Version.objects.get_or_create(key=key, defaults={'value': time.time_ns() // 1000})[0].value
+    return version
+
+
+def current_version(key: str = LEADERBOARD_VERSION_KEY) -> int:
+    """
+    Returns the version under `key` as this process last read it, reading it from the database again
+    only once it is `LEADERBOARD_VERSION_TTL` seconds old, so that requests answered from a cache do
+    not query at all.
+    """
+    now = time.monotonic()
+    read = _versions.get(key)
+    if read is not None and now - read[1] < settings.LEADERBOARD_VERSION_TTL:
+        return read[0]
+    version = get_version(key)
+    _versions[key] = (version, now)
+    return version
+
+
+def forget_versions():
+    """
+    Drops the versions this process read, so that the next ones come from the database.
+    """
+    _versions.clear()
+
+
+def bump_version(key: str = LEADERBOARD_VERSION_KEY) -> int:
+    """
+    Invalidates every response cached for the current version, or whatever depends on `key`, in
+    every process.
+    """
+    with transaction.atomic():
+        get_version(key)
+        Version.objects.filter(key=key).update(value=F('value') + 1)
+        # this process sees its own bump right away, the others once their read version expires
+        _versions.pop(key, None)
+        return Version.objects.filter(key=key).values_list('value', flat=True).get()
+
+
+def make_etag(version: int, *parts: str) -> str:
+    """
+    Strong ETag of a representation, identified by the scores version and whatever else it depends on.
+    """
+    digest = hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+    return f'"{version}-{digest}"'
+
+
+def get_response(etag: str):
+    return cache.get(f'leaderboard:response:{etag}')
+
+
+def set_response(etag: str, content: bytes, content_type: str):
+    cache.set(f'leaderboard:response:{etag}', (content, content_type), RESPONSE_CACHE_TIMEOUT)
@@ -1,13 +1,18 @@
-import json
-import re
-from typing import List, Optional, Dict, Union
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from itertools import chain
+from typing import List, NamedTuple, Optional, Dict, Union
 
 import dateutil.parser
-import requests
-from bs4 import BeautifulSoup
+from django.db import transaction
 
-from leaderboard.models import Label, Issue, Repository, GithubUser, PullRequest
-from leaderboard.utils import CONTRIBUTION_ACCEPTED_TOPIC, GITHUB_TOKEN
+from leaderboard.github import GraphQLClient, graphql_client
+from leaderboard.models import Label, Issue, Repository, GithubUser, PullRequest, ContributorScore
+from leaderboard.persistence import UpsertBatch, unit_of_work
+from leaderboard.ranking import rank_index
+from leaderboard.references import IssueReference, closing_references, resolve_references
+from leaderboard.scoring import track_scores
+from leaderboard.utils import CONTRIBUTION_ACCEPTED_TOPIC
 
 
 def get_data_model(data, items: List) -> List['FromDictMixin']:
@@ -20,7 +25,45 @@ def get_data_model(data, items: List) -> List['FromDictMixin']:
     return ret
 
 
-class FromDictMixin:
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parses timestamps as GitHub sends them, `YYYY-MM-DDTHH:MM:SSZ`, leaving anything else to dateutil.
+    """
+    if len(value) == 20 and value[4] == '-' and value[10] == 'T' and value[19] == 'Z':
+        try:
+            return datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return dateutil.parser.parse(value)
+
+
+def save(*items: 'FromDictMixin') -> UpsertBatch:
+    """
+    Writes the rows of data models, and of the data models nested in them, in one batch.
+    """
+    batch = UpsertBatch()
+    for item in items:
+        item.collect(batch)
+    with transaction.atomic():
+        batch.flush()
+        create_scores(batch.created[GithubUser])
+    return batch
+
+
+def create_scores(users: 'list[GithubUser]'):
+    """
+    Gives new users their zero points score.
+    """
+    if not users:
+        return
+    ContributorScore.objects.bulk_create([ContributorScore(user=user) for user in users])
+    transaction.on_commit(lambda: rank_index.move([(None, 0)] * len(users)))
+
+
+class FromDictMixin(ABC):
+    # data models are short-lived records of the payload fields written to the database, the rest
+    # of a payload is dropped
+    __slots__ = ()
 
     @classmethod
     def from_dict(cls, data: Dict):
@@ -31,8 +74,15 @@ class FromDictMixin:
         # noinspection PyArgumentList
         return cls(**data[cls.__name__.lower()])
 
+    @abstractmethod
+    def collect(self, batch: UpsertBatch):
+        """
+        Adds the rows of this data model, and of the data models nested in it, to `batch`.
+        """
+
 
 class UserData(FromDictMixin):
+    __slots__ = ('login', 'id', 'avatar_url')
     key = 'user'
 
     def __init__(
@@ -45,42 +95,44 @@ class UserData(FromDictMixin):
         self.login = login
         self.id = id
         self.avatar_url = avatar_url
-        self.extra = kwargs
+
+    def collect(self, batch: UpsertBatch):
+        batch.add(GithubUser, self.id, {'username': self.login, 'avatar_url': self.avatar_url}, update=False)
 
     def to_model(self) -> 'GithubUser':
-        return GithubUser.objects.get_or_create(id=self.id, defaults={
-            'username': self.login,
-            'avatar_url': self.avatar_url,
-        })[0]
+        return save(self).get(GithubUser, self.id)
 
 
 class SenderData(UserData):
+    __slots__ = ()
     key = 'sender'
-    pass
 
 
 class LabelData(FromDictMixin):
+    __slots__ = ('name', 'color')
     key = 'label'
 
     def __init__(
             self,
-            id: int,
-            url: str,
             name: str,
             color: str,
             **kwargs,
     ):
-        self.id = id
-        self.url = url
         self.name = name
         self.color = color
-        self.extra = kwargs
+
+    def collect(self, batch: UpsertBatch):
+        batch.add(Label, self.name, {'color': self.color})
 
     def to_model(self) -> 'Label':
-        return Label.objects.update_or_create(name=self.name, defaults={'color': self.color})[0]
+        return save(self).get(Label, self.name)
 
 
 class IssueData(FromDictMixin):
+    __slots__ = (
+        'id', 'title', 'url', 'user', 'labels', 'state', 'locked', 'assignee', 'created_at', 'updated_at',
+        'closed_at', 'repository',
+    )
     key = 'issue'
 
     def __init__(
@@ -88,8 +140,6 @@ class IssueData(FromDictMixin):
             id: int,
             title: str,
             url: str,
-            repository_url: str,
-            html_url: str,
             user: dict,
             labels: List[Dict],
             state: ['open', 'closed'],
@@ -105,88 +155,89 @@ class IssueData(FromDictMixin):
         self.id = id
         self.title = title
         self.url = url
-        self.repository_url = repository_url
-        self.html_url = html_url
         self.user = UserData(**user)
         self.labels = [LabelData(**label) for label in labels]
         self.state = state
         self.locked = locked
         self.assignee = UserData(**assignee) if assignee else None
-        self.created_at = dateutil.parser.parse(created_at)
-        self.updated_at = dateutil.parser.parse(updated_at)
-        self.closed_at = dateutil.parser.parse(closed_at) if closed_at else None
+        self.created_at = parse_timestamp(created_at)
+        self.updated_at = parse_timestamp(updated_at)
+        self.closed_at = parse_timestamp(closed_at) if closed_at else None
         self.repository: Union[RepositoryData, Repository]
         if repository:
             self.repository = repository
         else:
             self.repository: RepositoryData = RepositoryData(**parent_data['repository'])
-        self.extra = kwargs
+
+    def collect(self, batch: UpsertBatch):
+        self.user.collect(batch)
+        if self.assignee:
+            self.assignee.collect(batch)
+        if isinstance(self.repository, RepositoryData):
+            self.repository.collect(batch)
+        for label in self.labels:
+            label.collect(batch)
+        batch.add(Issue, self.id, {
+            'title': self.title,
+            'url': self.url,
+            'locked': self.locked,
+            'repository_id': self.repository.id,
+            'state': self.state,
+            'assignee_id': self.assignee.id if self.assignee else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'closed_at': self.closed_at,
+            'user_id': self.user.id,
+        })
+        batch.set_links(Issue.labels, self.id, [label.name for label in self.labels])
 
     def to_model(self) -> 'Issue':
-        issue = Issue.objects.update_or_create(
-            id=self.id,
-            defaults={
-                'title': self.title,
-                'url': self.url,
-                'locked': self.locked,
-                'repository': self.repository.to_model() if isinstance(
-                    self.repository,
-                    RepositoryData
-                ) else self.repository,
-                'state': self.state,
-                'assignee': self.assignee.to_model() if self.assignee else None,
-                'created_at': self.created_at,
-                'updated_at': self.updated_at,
-                'closed_at': self.closed_at,
-                'user': self.user.to_model(),
-            }
-        )[0]
-        issue.labels.set([label.to_model() for label in self.labels])
-        return issue
+        return save_issues([self]).get(Issue, self.id)
 
 
 class RepositoryData(FromDictMixin):
+    __slots__ = ('id', 'name', 'topics')
     key = 'repository'
 
     def __init__(
             self,
             id: int,
             name: str,
-            full_name: str,
-            private: bool,
             topics: List[str],
             **kwargs,
     ):
         self.id = id
         self.name = name
-        self.full_name = full_name
-        self.private = private
         self.topics = topics
-        self.extra = kwargs
+
+    def collect(self, batch: UpsertBatch):
+        batch.add(Repository, self.id, {
+            'name': self.name,
+            'consider_contributions': True if CONTRIBUTION_ACCEPTED_TOPIC in self.topics else False,
+        })
 
     def to_model(self) -> 'Repository':
-        return Repository.objects.update_or_create(
-            id=self.id,
-            defaults={
-                'name': self.name,
-                'consider_contributions': True if CONTRIBUTION_ACCEPTED_TOPIC in self.topics else False,
-            }
-        )[0]
+        return save(self).get(Repository, self.id)
 
 
 class PullRequestData(FromDictMixin):
+    __slots__ = (
+        'id', 'node_id', 'url', 'html_url', 'state', 'locked', 'title', 'user', 'body', 'created_at', 'updated_at',
+        'closed_at', 'merged_at', 'merged', 'repository',
+    )
     key = 'pull_request'
 
     def __init__(
             self,
             id: int,
+            node_id: str,
             url: str,
             html_url: str,
             state: ['open', 'closed'],
             locked: bool,
             title: str,
             user: Dict,
-            body: str,
+            body: Optional[str],
             created_at: str,
             updated_at: str,
             closed_at: Optional[str],
@@ -198,17 +249,19 @@ class PullRequestData(FromDictMixin):
             **kwargs,
     ):
         self.id = id
+        self.node_id = node_id
         self.url = url
         self.html_url = html_url
         self.state = state
         self.locked = locked
         self.title = title
         self.user = UserData(**user)
-        self.body = body
-        self.created_at = dateutil.parser.parse(created_at)
-        self.updated_at = dateutil.parser.parse(updated_at)
-        self.closed_at = dateutil.parser.parse(closed_at) if closed_at else None
-        self.merged_at = dateutil.parser.parse(merged_at) if merged_at else None
+        # GitHub sends a null body for pull requests opened without a description
+        self.body = body or ''
+        self.created_at = parse_timestamp(created_at)
+        self.updated_at = parse_timestamp(updated_at)
+        self.closed_at = parse_timestamp(closed_at) if closed_at else None
+        self.merged_at = parse_timestamp(merged_at) if merged_at else None
         # self.labels = [LabelData(**label) for label in labels]
         self.merged = merged
         self.repository: Union[RepositoryData, Repository]
@@ -216,59 +269,138 @@ class PullRequestData(FromDictMixin):
             self.repository = repository
         else:
             self.repository: RepositoryData = RepositoryData(**parent_data['repository'])
-        self.extra = kwargs
+
+    def collect(self, batch: UpsertBatch):
+        self.user.collect(batch)
+        if isinstance(self.repository, RepositoryData):
+            self.repository.collect(batch)
+        batch.add(PullRequest, self.id, {
+            'url': self.url,
+            'html_url': self.html_url,
+            'title': self.title,
+            'body': self.body,
+            'state': self.state,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'closed_at': self.closed_at,
+            'merged_at': self.merged_at,
+            'merged': self.merged,
+            'repository_id': self.repository.id,
+            'user_id': self.user.id,
+        })
 
     def to_model(self) -> 'PullRequest':
-        pr = PullRequest.objects.update_or_create(
-            id=self.id,
-            defaults={
-                'url': self.url,
-                'html_url': self.html_url,
-                'title': self.title,
-                'body': self.body,
-                'state': self.state,
-                'created_at': self.created_at,
-                'updated_at': self.updated_at,
-                'closed_at': self.closed_at,
-                'merged_at': self.merged_at,
-                'merged': self.merged,
-                'repository': self.repository.to_model() if isinstance(
-                    self.repository,
-                    RepositoryData
-                ) else self.repository,
-                'user': self.user.to_model(),
-            }
-        )[0]
+        batch = save_pull_requests([self])
+        pr = batch.get(PullRequest, self.id)
+        pr.repository = batch.get(Repository, self.repository.id) if isinstance(
+            self.repository,
+            RepositoryData
+        ) else self.repository
 
         # pr.labels.set([label.to_model() for label in self.labels])
-        self.update_linked_issues(pr)
         return pr
 
-    @staticmethod
-    def update_linked_issues(pr: 'PullRequest') -> 'list[Issue]':
-        response = requests.get(pr.html_url, headers={'Authorization': f'token {GITHUB_TOKEN}'})
-        soup = BeautifulSoup(response.text, 'html.parser')
-        issue_form = soup.find("form", {"aria-label": re.compile('Link issues')})
-        issues: 'list[Issue]' = []
-        if not issue_form:
-            return issues
-
-        for issue_tag in issue_form.find_all('a'):
-            try:
-                issue_url = issue_tag['href']
-                issue_id = json.loads(issue_tag["data-hydro-click"])['payload']['issue_id']
-                try:
-                    issue = Issue.objects.get(id=issue_id)
-                except Issue.DoesNotExist:
-                    issue_data = requests.get(
-                        issue_url.replace('https://github.com', 'https://api.github.com/repos'),
-                        headers={'Authorization': f'token {GITHUB_TOKEN}'},
-                    ).json()
-                    issue = IssueData(**issue_data, repository=pr.repository).to_model()
-                issues.append(issue)
-            except KeyError:
-                pass
-
-        pr.issue_set.set(issues)
-
-        return issues
+
+def save_issues(issues: 'list[IssueData]') -> UpsertBatch:
+    """
+    Writes issues in one batch, applying the points they and the pull requests closing them gain
+    or lose to scores.
+    """
+    with unit_of_work(), track_scores() as tracker:
+        ids = [issue.id for issue in issues]
+        tracker.track(Issue, ids)
+        tracker.track(PullRequest, Issue.objects.filter(id__in=ids).values('pr_id'))
+        return save(*issues)
+
+
+def save_pull_requests(
+        pull_requests: 'list[PullRequestData]',
+        client: Optional[GraphQLClient] = None,
+) -> UpsertBatch:
+    """
+    Writes pull requests in one batch and links them to the issues they close, applying the points
+    they gain or lose to scores. GitHub is asked for the issues before the transaction opens, so
+    that a slow or throttled request never holds it.
+    """
+    closing_issues = find_closing_issues(pull_requests, client)
+    with unit_of_work(), track_scores() as tracker:
+        tracker.track(PullRequest, [pull_request.id for pull_request in pull_requests])
+        batch = save(*pull_requests)
+        link_issues(closing_issues)
+    return batch
+
+
+class ClosingIssues(NamedTuple):
+    # closing references of the description of every pull request, by id
+    references: Dict[int, List[IssueReference]]
+    # issues known locally among them
+    resolved: Dict[IssueReference, Issue]
+    # issues GitHub links to every pull request, empty unless it was asked
+    linked: Dict[int, List['IssueData']]
+
+
+def find_closing_issues(
+        pull_requests: 'list[PullRequestData]',
+        client: Optional[GraphQLClient] = None,
+) -> ClosingIssues:
+    """
+    Finds the issues pull requests close from their descriptions, as far as those are known locally,
+    reading all of them in one query. GitHub is only asked for the closing references of pull
+    requests with some unknown, or with none in their description since issues can also be linked
+    from the sidebar, in one request per 100 pull requests.
+    """
+    client = client or graphql_client
+    references = {pr.id: closing_references(pr.body, pr.url) for pr in pull_requests}
+    resolved = resolve_references(chain.from_iterable(references.values()))
+    unresolved = [
+        pr.node_id for pr in pull_requests
+        if not references[pr.id] or any(reference not in resolved for reference in references[pr.id])
+    ]
+    remote = client.closing_issues(unresolved) if unresolved else {}
+    linked = {
+        pr.id: [IssueData.from_dict(data) for data in remote.get(pr.node_id, [])]
+        for pr in pull_requests
+    }
+    return ClosingIssues(references, resolved, linked)
+
+
+def link_issues(closing_issues: ClosingIssues) -> 'dict[int, list[Issue]]':
+    """
+    Links pull requests to the issues `find_closing_issues` found, writing those no webhook brought yet.
+    """
+    references, resolved, linked = closing_issues
+    with unit_of_work() as identity_map, track_scores() as tracker:
+        known = identity_map[Issue]
+        remote_issues = {issue.id: issue for issue in chain.from_iterable(linked.values())}
+        # read again, as their pull request may have changed since they were resolved
+        known.update(Issue.objects.in_bulk([
+            id for id in chain((issue.id for issue in resolved.values()), remote_issues) if id not in known
+        ]))
+        # issues GitHub knows about but no webhook brought yet are written in one batch
+        missing = [issue for id, issue in remote_issues.items() if id not in known]
+        if missing:
+            tracker.track(Issue, [issue.id for issue in missing])
+            save(*missing)
+        issues = {
+            pr_id: [known[id] for id in dict.fromkeys(chain(
+                (resolved[reference].id for reference in references[pr_id] if reference in resolved),
+                (issue.id for issue in linked[pr_id]),
+            )) if id in known]
+            for pr_id in references
+        }
+
+        # pull requests losing an issue to these ones lose its points
+        tracker.track(PullRequest, list(issues) + [
+            issue.pr_id for issue in chain.from_iterable(issues.values()) if issue.pr_id
+        ])
+        linked_ids = [issue.id for issue in chain.from_iterable(issues.values())]
+        Issue.objects.filter(pr_id__in=issues).exclude(id__in=linked_ids).update(pr=None)
+        relinked = []
+        for pr_id, pr_issues in issues.items():
+            for issue in pr_issues:
+                if issue.pr_id != pr_id:
+                    issue.pr_id = pr_id
+                    relinked.append(issue)
+        Issue.objects.bulk_update(relinked, ['pr'])
+
+    return issues
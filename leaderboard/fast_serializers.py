@@ -0,0 +1,181 @@
+"""
+Read-only serialization of contributors built from `.values()` rows, producing the same JSON as
+`GithubUserSerializer` without instantiating models, serializer fields or `to_representation`
+calls for every nested row.
+"""
+import json
+from collections import defaultdict
+from datetime import datetime
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+from django.db.models import Prefetch, QuerySet
+from django.utils import timezone
+
+from .models import Issue
+from .serializers import (
+    GithubUserSerializer, IssueSerializer, LabelSerializer, PullRequestSerializer, RepositorySerializer,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    """
+    Encodes `data` like DRF's `JSONRenderer`: compact, UTF-8, with U+2028 and U+2029 escaped.
+    """
+    if orjson is not None:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+    return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def format_datetime(value: datetime) -> str:
+    """
+    Same output as DRF's `DateTimeField` with the default ISO 8601 format.
+    """
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class Extractor:
+    """
+    Turns `.values()` rows into output dicts with the keys of `fields`, in that order. Each key is
+    read from the row key given in `sources`, defaulting to the key itself, and passed through its
+    converter in `converters` unless it is `None`.
+    """
+
+    def __init__(
+            self,
+            fields: Sequence[str],
+            sources: Optional[Dict[str, str]] = None,
+            converters: Optional[Dict[str, Callable]] = None,
+    ):
+        sources = sources or {}
+        converters = converters or {}
+        self.keys = tuple(fields)
+        self.columns = tuple(sources.get(field, field) for field in fields)
+        getter = itemgetter(*self.columns)
+        self.getter = getter if len(fields) > 1 else lambda row: (getter(row),)
+        self.converters = tuple(
+            (i, converters[field]) for i, field in enumerate(fields) if field in converters
+        )
+
+    def __call__(self, row: dict) -> dict:
+        values = self.getter(row)
+        if self.converters:
+            values = list(values)
+            for i, converter in self.converters:
+                if values[i] is not None:
+                    values[i] = converter(values[i])
+        return dict(zip(self.keys, values))
+
+
+DATETIME_CONVERTERS = {
+    'created_at': format_datetime,
+    'updated_at': format_datetime,
+    'closed_at': format_datetime,
+}
+
+extract_label = Extractor(LabelSerializer.Meta.fields, sources={
+    'name': 'label__name',
+    'color': 'label__color',
+    'points': 'label__points',
+})
+extract_repository = Extractor(RepositorySerializer.Meta.fields, sources={
+    'id': 'repository_id',
+    'name': 'repository__name',
+})
+extract_issue = Extractor(
+    IssueSerializer.Meta.fields,
+    sources={'points': 'computed_points'},
+    converters=DATETIME_CONVERTERS,
+)
+extract_pull_request = Extractor(
+    PullRequestSerializer.Meta.fields,
+    sources={'points': 'computed_points'},
+    converters=DATETIME_CONVERTERS,
+)
+extract_user = Extractor(GithubUserSerializer.Meta.fields, sources={'points': 'computed_points'})
+
+ISSUE_COLUMNS = ('user_id', 'repository__name') + tuple(
+    column for column in extract_issue.columns if column not in ('labels', 'repository')
+) + ('repository_id',)
+PULL_REQUEST_COLUMNS = ('user_id', 'repository__name') + tuple(
+    column for column in extract_pull_request.columns if column != 'repository'
+) + ('repository_id',)
+
+
+def _prefetched_querysets(queryset: QuerySet) -> Dict[str, QuerySet]:
+    return {
+        lookup.to_attr: lookup.queryset
+        for lookup in queryset._prefetch_related_lookups
+        if isinstance(lookup, Prefetch)
+    }
+
+
+def _group_by_user(rows: Iterable[dict], extract: Extractor) -> Dict[int, list]:
+    grouped = defaultdict(list)
+    for row in rows:
+        row['repository'] = extract_repository(row)
+        grouped[row['user_id']].append(extract(row))
+    return grouped
+
+
+def serialize_contributors(queryset: QuerySet, fields: Optional[Sequence[str]] = None) -> list:
+    """
+    Serializes users of a queryset prepared with `GithubUserQuerySet.with_contributions`, reading
+    issues and pull requests through the same querysets as its prefetch lookups, in at most four
+    queries. `fields` restricts the output like `GithubUserSerializer`'s `fields` argument.
+    Feature labels are read from the database like the prefetch lookups do, so that both always agree.
+    """
+    extract = extract_user
+    if fields is not None:
+        extract = Extractor(
+            [field for field in GithubUserSerializer.Meta.fields if field in fields],
+            sources={'points': 'computed_points'},
+        )
+    prefetched = _prefetched_querysets(queryset)
+    queryset = queryset.prefetch_related(None)
+    users = list(queryset.values('id', *(
+        column for column in extract.columns if column not in ('id', 'issues', 'pull_requests')
+    )))
+    # contributions are read for the same users with a subquery rather than a parameter per user,
+    # which databases limit
+    user_ids = queryset.order_by().values('pk')
+
+    if 'issues' in extract.keys:
+        issues = prefetched['prefetched_issues'].prefetch_related(None).filter(user_id__in=user_ids)
+        issue_rows = list(issues.values(*ISSUE_COLUMNS))
+        labels = defaultdict(list)
+        feature_labels = Issue.labels.through.objects.filter(
+            issue_id__in=issues.values('pk'),
+            label__points__gt=0,
+        ).order_by('label_id').values('issue_id', 'label__name', 'label__color', 'label__points')
+        for row in feature_labels:
+            labels[row['issue_id']].append(extract_label(row))
+        for row in issue_rows:
+            row['labels'] = labels.get(row['id'], [])
+        issues = _group_by_user(issue_rows, extract_issue)
+        for user in users:
+            user['issues'] = issues.get(user['id'], [])
+
+    if 'pull_requests' in extract.keys:
+        pull_requests = _group_by_user(
+            prefetched['prefetched_pull_requests'].filter(user_id__in=user_ids).values(*PULL_REQUEST_COLUMNS),
+            extract_pull_request,
+        )
+        for user in users:
+            user['pull_requests'] = pull_requests.get(user['id'], [])
+
+    return [extract(user) for user in users]
+
+
+def render_contributors(queryset: QuerySet, fields: Optional[Sequence[str]] = None) -> bytes:
+    return dumps(serialize_contributors(queryset, fields))
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import requests
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .utils import GITHUB_TOKEN
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_URL = 'https://api.github.com/graphql'
+API_URL = 'https://api.github.com'
+# seconds to connect, then to wait for each read
+TIMEOUT = (3.05, 10)
+POOL_SIZE = 10
+RETRIES = 3
+# cache shared by every process, see `CACHES`
+ETAG_CACHE = 'github'
+ETAG_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# `nodes` accepts at most 100 ids per query
+MAX_NODES = 100
+# author of the issues of deleted accounts, as the REST API shows it
+GHOST = {'login': 'ghost', 'id': 10137, 'avatar_url': 'https://avatars.githubusercontent.com/u/10137?v=4'}
+
+# posts a request body to a url with headers, and returns the response body
+Transport = Callable[[str, bytes, Dict[str, str]], bytes]
+
+CLOSING_ISSUES_QUERY = '''
+query ($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    ... on PullRequest {
+      id
+      closingIssuesReferences(first: 50) {
+        nodes {
+          databaseId
+          number
+          title
+          url
+          state
+          locked
+          createdAt
+          updatedAt
+          closedAt
+          author { login avatarUrl ... on User { databaseId } ... on Bot { databaseId } }
+          assignees(first: 1) { nodes { login avatarUrl databaseId } }
+          labels(first: 50) { nodes { id name color url } }
+          repository {
+            databaseId
+            name
+            nameWithOwner
+            isPrivate
+            repositoryTopics(first: 50) { nodes { topic { name } } }
+          }
+        }
+      }
+    }
+  }
+}
+'''
+
+
+class GraphQLError(Exception):
+
+    def __init__(self, errors: List[dict]):
+        super().__init__('; '.join(error.get('message', '') for error in errors))
+        self.errors = errors
+
+
+class Throttle:
+    """
+    Token bucket slowing requests down once less than `slow_down_below` of a rate limit is left,
+    so that what remains is spread until the limit resets instead of being spent at once. Requests
+    are not throttled while plenty is left, and wait for the reset once nothing is.
+    """
+
+    def __init__(
+            self,
+            slow_down_below: float = 0.2,
+            capacity: int = 10,
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], None] = time.sleep,
+            wall_clock: Callable[[], float] = time.time,
+    ):
+        self.slow_down_below = slow_down_below
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        # `X-RateLimit-Reset` is a Unix timestamp
+        self.wall_clock = wall_clock
+        self._lock = threading.Lock()
+        # tokens per second, `None` while not throttled
+        self.rate: Optional[float] = None
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.resume_at = 0.0
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def update(self, headers: Mapping[str, str]):
+        """
+        Adjusts the rate to the `X-RateLimit-*` and `Retry-After` headers of a response.
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if 'Retry-After' in headers:
+                self.resume_at = max(self.resume_at, now + int(headers['Retry-After']))
+            if 'X-RateLimit-Remaining' not in headers:
+                return
+            limit = int(headers['X-RateLimit-Limit'])
+            remaining = int(headers['X-RateLimit-Remaining'])
+            until_reset = max(int(headers['X-RateLimit-Reset']) - self.wall_clock(), 1)
+            if remaining == 0:
+                self.resume_at = max(self.resume_at, now + until_reset)
+                self.rate = None
+            elif remaining > limit * self.slow_down_below:
+                self.rate = None
+            else:
+                if self.rate is None:
+                    self.tokens = min(self.tokens, 1.0)
+                self.rate = remaining / until_reset
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                if now < self.resume_at:
+                    wait = self.resume_at - now
+                elif self.rate is None:
+                    return
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+def _resource(url: str) -> str:
+    # GitHub counts each resource against its own rate limit
+    if url.startswith(GRAPHQL_URL):
+        return 'graphql'
+    if url.startswith(f'{API_URL}/search/'):
+        return 'search'
+    return 'core'
+
+
+def _rate_limited(response: requests.Response) -> bool:
+    return response.status_code in (403, 429) and (
+        response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers
+    )
+
+
+class GithubClient:
+    """
+    HTTP client shared by everything calling GitHub. Connections are kept alive in a bounded pool,
+    requests time out and are retried with backoff on server errors, and each rate limit has its
+    `Throttle`. `get_json` sends back the ETag of the last response to a url, so that unchanged
+    resources come back as 304s, which do not count against the rate limit. ETags are kept in the
+    `github` cache, which every process shares.
+    """
+
+    def __init__(
+            self,
+            token: str = GITHUB_TOKEN,
+            timeout: Union[float, Tuple[float, float]] = TIMEOUT,
+            pool_size: int = POOL_SIZE,
+            retries: int = RETRIES,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.throttles: Dict[str, Throttle] = defaultdict(Throttle)
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'token {token}',
+            'Accept': 'application/vnd.github+json',
+            'User-Agent': 'leaderboard',
+        })
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.5,
+                status_forcelist=(500, 502, 503, 504),
+                # GraphQL queries are posted, and as safe to repeat as GETs
+                allowed_methods=frozenset({'GET', 'HEAD', 'POST'}),
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request once its rate limit allows it, waiting for the limit to reset and trying
+        again when GitHub still turned it down for exceeding the limit.
+        """
+        throttle = self.throttles[_resource(url)]
+        kwargs.setdefault('timeout', self.timeout)
+        for _ in range(self.retries + 1):
+            throttle.acquire()
+            response = self.session.request(method, url, **kwargs)
+            throttle.update(response.headers)
+            if not _rate_limited(response):
+                break
+            logger.warning(f'GitHub rate limit exceeded requesting {url}')
+        response.raise_for_status()
+        return response
+
+    def get_json(self, url: str, params: Optional[dict] = None) -> Any:
+        """
+        Reads a resource of the REST API, from the cache when GitHub answers it did not change.
+        """
+        return self.get_page(url, params)[0]
+
+    def get_page(self, url: str, params: Optional[dict] = None) -> Tuple[Any, Dict[str, str]]:
+        """
+        Like `get_json`, also returning the urls of the `Link` header by relation, e.g. `next` or `last`.
+        """
+        url = requests.Request('GET', url, params=params).prepare().url
+        key = f'github:page:{hashlib.sha1(url.encode()).hexdigest()}'
+        cache = caches[ETAG_CACHE]
+        cached = cache.get(key)
+        response = self.request('GET', url, headers={'If-None-Match': cached[0]} if cached else {})
+        if response.status_code == 304 and cached:
+            return json.loads(cached[1]), cached[2]
+        links = {rel: link['url'] for rel, link in response.links.items()}
+        if 'ETag' in response.headers:
+            cache.set(key, (response.headers['ETag'], response.content, links), ETAG_CACHE_TIMEOUT)
+        return response.json(), links
+
+    def post(self, url: str, body: bytes, headers: Dict[str, str]) -> bytes:
+        return self.request('POST', url, data=body, headers=headers).content
+
+
+github_client = GithubClient()
+
+
+def _user(node: Optional[dict]) -> dict:
+    if not node or node.get('databaseId') is None:
+        return GHOST
+    return {'login': node['login'], 'id': node['databaseId'], 'avatar_url': node['avatarUrl']}
+
+
+def _issue_event(node: dict) -> dict:
+    """
+    Reshapes an issue of the GraphQL API like the payload of an `issues` webhook, which
+    `IssueData.from_dict` reads.
+    """
+    repository = node['repository']
+    repository_url = f"{API_URL}/repos/{repository['nameWithOwner']}"
+    assignees = node['assignees']['nodes']
+    return {
+        'issue': {
+            'id': node['databaseId'],
+            'number': node['number'],
+            'title': node['title'],
+            'url': f"{repository_url}/issues/{node['number']}",
+            'repository_url': repository_url,
+            'html_url': node['url'],
+            'user': _user(node['author']),
+            'labels': [
+                {'id': label['id'], 'url': label['url'], 'name': label['name'], 'color': label['color']}
+                for label in node['labels']['nodes']
+            ],
+            'state': node['state'].lower(),
+            'locked': node['locked'],
+            'assignee': _user(assignees[0]) if assignees else None,
+            'created_at': node['createdAt'],
+            'updated_at': node['updatedAt'],
+            'closed_at': node['closedAt'],
+        },
+        'repository': {
+            'id': repository['databaseId'],
+            'name': repository['name'],
+            'full_name': repository['nameWithOwner'],
+            'private': repository['isPrivate'],
+            'topics': [topic['topic']['name'] for topic in repository['repositoryTopics']['nodes']],
+        },
+    }
+
+
+class GraphQLClient:
+    """
+    Client of GitHub's GraphQL API. Requests go through `transport`, `github_client` by default.
+    """
+
+    def __init__(self, transport: Optional[Transport] = None, url: str = GRAPHQL_URL):
+        self.transport = transport or github_client.post
+        self.url = url
+
+    def execute(self, query: str, variables: Optional[dict] = None) -> dict:
+        """
+        Runs `query` and returns its data. Errors only fail the query when they left no data, as
+        GitHub also reports nodes it could not resolve next to the ones it could.
+        """
+        content = self.transport(self.url, json.dumps({'query': query, 'variables': variables or {}}).encode(), {
+            'Content-Type': 'application/json',
+        })
+        response = json.loads(content)
+        errors = response.get('errors')
+        if response.get('data') is None:
+            raise GraphQLError(errors or [{'message': 'no data'}])
+        if errors:
+            logger.warning(f'GitHub GraphQL API errors: {GraphQLError(errors)}')
+        return response['data']
+
+    def closing_issues(self, pull_request_ids: Iterable[str]) -> Dict[str, List[dict]]:
+        """
+        Issues each pull request, given by node id, closes once merged, as `issues` webhook
+        payloads. Up to `MAX_NODES` pull requests are read per request.
+        """
+        pull_request_ids = list(dict.fromkeys(pull_request_ids))
+        issues: Dict[str, List[dict]] = {id: [] for id in pull_request_ids}
+        for start in range(0, len(pull_request_ids), MAX_NODES):
+            data = self.execute(CLOSING_ISSUES_QUERY, {'ids': pull_request_ids[start:start + MAX_NODES]})
+            for node in data['nodes']:
+                if node and 'closingIssuesReferences' in node:
+                    issues[node['id']] = [
+                        _issue_event(issue) for issue in node['closingIssuesReferences']['nodes'] if issue
+                    ]
+        return issues
+
+
+graphql_client = GraphQLClient()
@@ -0,0 +1,60 @@
+import threading
+from typing import Dict, FrozenSet, Optional
+
+from django.db import transaction
+
+from .caching import LABELS_VERSION_KEY, bump_version, current_version, get_version
+from .models import Label
+
+
+class LabelRegistry:
+    """
+    Scoring labels, those carrying positive points, held in memory so that checking whether a
+    label scores is a set lookup. The registry reloads them once their version moved in the
+    database, which label writes of any process do through `invalidate`, and reads that version at
+    most every `LEADERBOARD_VERSION_TTL` seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels: Dict[str, Label] = {}
+        self._names: FrozenSet[str] = frozenset()
+        self._version: Optional[int] = None
+
+    def refresh(self):
+        # version first: a write committed meanwhile only makes the registry look older than it is
+        version = get_version(LABELS_VERSION_KEY)
+        labels = {label.name: label for label in Label.objects.filter(points__gt=0).order_by('name')}
+        with self._lock:
+            self._labels, self._names, self._version = labels, frozenset(labels), version
+
+    def _current(self) -> Dict[str, Label]:
+        if self._version != current_version(LABELS_VERSION_KEY):
+            self.refresh()
+        return self._labels
+
+    @property
+    def names(self) -> FrozenSet[str]:
+        self._current()
+        return self._names
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._current()
+
+    def get(self, name: str) -> Optional[Label]:
+        return self._current().get(name)
+
+    def points(self, name: str) -> int:
+        label = self.get(name)
+        return label.points if label else 0
+
+    def invalidate(self):
+        """
+        Drops the labels of this process right away, and those of every process once the write commits.
+        """
+        with self._lock:
+            self._version = None
+        transaction.on_commit(lambda: bump_version(LABELS_VERSION_KEY))
+
+
+label_registry = LabelRegistry()
@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+
+from leaderboard.data_models import IssueData, PullRequestData, RepositoryData, save_issues, save_pull_requests
+from leaderboard.github import API_URL, GraphQLClient, github_client
+from leaderboard.scoring import publish_scores
+from leaderboard.webhooks import to_consider
+
+
+class Checkpoint:
+    """
+    Full pages of every repository written so far, saved after each page so that an interrupted
+    backfill resumes where it stopped.
+    """
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.state: Dict[str, Dict[str, Dict[str, List[int]]]] = {}
+        if not restart and os.path.exists(path):
+            with open(path) as file:
+                self.state = json.load(file)
+
+    def pages(self, repository: str, kind: str, per_page: int) -> List[int]:
+        """
+        The pages of a listing already written, which hold other items with another `per_page`.
+        """
+        return self.state.setdefault(repository, {}).setdefault(kind, {}).setdefault(str(per_page), [])
+
+    def save(self):
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.state, file)
+        os.replace(temporary_path, self.path)
+
+
+def page_number(url: Optional[str]) -> Optional[int]:
+    if url is None:
+        return None
+    return int(parse_qs(urlparse(url).query)['page'][0])
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports the existing issues and pull requests of repositories, which webhooks only bring as they '
+        'change. Pages are fetched concurrently, and an interrupted backfill resumes where it stopped.'
+    )
+    # issues first, so that pull requests find the issues they close locally
+    kinds = ('issues', 'pulls')
+
+    def add_arguments(self, parser):
+        parser.add_argument('repositories', nargs='+', help='Repositories to backfill, as owner/name.')
+        parser.add_argument('--workers', type=int, default=4, help='Pages fetched at the same time.')
+        parser.add_argument('--per-page', type=int, default=100, help='Items per page, at most 100.')
+        parser.add_argument(
+            '--checkpoint', default=os.path.join(tempfile.gettempdir(), 'leaderboard-backfill.json'),
+            help='File recording the pages written so far.',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore the pages written by earlier runs.')
+        parser.add_argument('--api-url', default=API_URL, help='Root of the GitHub REST API.')
+
+    def handle(self, *args, **options):
+        self.api_url = options['api_url'].rstrip('/')
+        self.graphql_client = GraphQLClient(url=f'{self.api_url}/graphql')
+        self.per_page = options['per_page']
+        self.workers = options['workers']
+        self.checkpoint = Checkpoint(options['checkpoint'], options['restart'])
+
+        started = time.monotonic()
+        total = 0
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='backfill') as executor:
+            for full_name in options['repositories']:
+                total += self.backfill(executor, full_name)
+        seconds = time.monotonic() - started
+
+        if total:
+            publish_scores()
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {total} item(s) in {seconds:.1f}s, {total / max(seconds, 0.001):.1f} items/s'
+        ))
+
+    def backfill(self, executor: Executor, full_name: str) -> int:
+        repository = RepositoryData(**github_client.get_json(f'{self.api_url}/repos/{full_name}'))
+        if not to_consider(repository=repository, raise_exception=False):
+            self.stdout.write(self.style.WARNING(f'Skipped {full_name}, which does not accept contributions'))
+            return 0
+
+        started = time.monotonic()
+        count = sum(self.backfill_listing(executor, repository, full_name, kind) for kind in self.kinds)
+        seconds = time.monotonic() - started
+        self.stdout.write(
+            f'{full_name}: {count} item(s) in {seconds:.1f}s, {count / max(seconds, 0.001):.1f} items/s'
+        )
+        return count
+
+    def backfill_listing(self, executor: Executor, repository: RepositoryData, full_name: str, kind: str) -> int:
+        url = f'{self.api_url}/repos/{full_name}/{kind}'
+        params = {'state': 'all', 'sort': 'created', 'direction': 'asc', 'per_page': self.per_page}
+        done = self.checkpoint.pages(full_name, kind, self.per_page)
+
+        def fetch(page: int):
+            return github_client.get_page(url, dict(params, page=page))
+
+        # the first page tells how many there are, which grows as issues and pull requests are opened,
+        # and costs no rate limit once it comes back unchanged
+        items, links = fetch(1)
+        last = page_number(links.get('last')) or 1
+        count = 0
+        if 1 not in done:
+            count += self.write(kind, repository, items, done, 1)
+
+        remaining = [page for page in range(2, last + 1) if page not in done]
+        # pages are fetched a few at a time ahead of the writes, so that they do not pile up in memory
+        chunk = 2 * self.workers
+        for start in range(0, len(remaining), chunk):
+            numbers = remaining[start:start + chunk]
+            for page, (items, _) in zip(numbers, executor.map(fetch, numbers)):
+                count += self.write(kind, repository, items, done, page)
+        return count
+
+    def write(self, kind: str, repository: RepositoryData, items: List[dict], done: List[int], page: int) -> int:
+        if kind == 'issues':
+            # the issues of a repository include its pull requests
+            data = [IssueData(**item, repository=repository) for item in items if 'pull_request' not in item]
+            if data:
+                save_issues(data)
+        else:
+            # pull requests listed do not say whether they were merged, only when
+            data = [
+                PullRequestData(**dict(item, merged=item['merged_at'] is not None), repository=repository)
+                for item in items
+            ]
+            if data:
+                save_pull_requests(data, self.graphql_client)
+        # the last page gets the items opened later, so it is only done once full
+        if len(items) == self.per_page:
+            done.append(page)
+            self.checkpoint.save()
+        return len(data)
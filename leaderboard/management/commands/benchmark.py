@@ -0,0 +1,358 @@
+import codecs
+import hashlib
+import hmac
+import json
+import random
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Dict, Tuple, Type
+
+import dateutil.parser
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.utils import JSONParser
+from leaderboard.data_models import IssueData, PullRequestData
+from leaderboard.fast_serializers import render_contributors
+from leaderboard.models import ContributorScore, GithubUser, Label, Repository, Issue, PullRequest
+from leaderboard.scoring import create_scores, labelled_contributors, rebuild_rollups, rescore_contributors
+from leaderboard.serializers import GithubUserSerializer
+from leaderboard.utils import GITHUB_WEBHOOK_SECRET
+from leaderboard.views import GithubWebhookListenerView
+
+# far above real GitHub ids, so that benchmark rows never collide with real ones
+FIRST_ID = 10 ** 12
+
+
+class DictRecord:
+    """
+    Data models as they were before `__slots__`, the baseline of `benchmark payloads`: attributes
+    in a `__dict__`, the payload fields they did not read kept in `extra`, and timestamps parsed by
+    dateutil.
+    """
+    fields: Tuple[str, ...] = ()
+    timestamps: Tuple[str, ...] = ()
+    nested: Dict[str, Type['DictRecord']] = {}
+
+    def __init__(self, parent_data: dict = None, **data):
+        for name in self.fields:
+            value = data.pop(name, None)
+            if value and name in self.timestamps:
+                value = dateutil.parser.parse(value)
+            elif value and name in self.nested:
+                record = self.nested[name]
+                value = [record(**item) for item in value] if isinstance(value, list) else record(**value)
+            setattr(self, name, value)
+        if 'repository' in self.fields and self.repository is None:
+            self.repository = DictRepository(**parent_data['repository'])
+        self.extra = data
+
+
+class DictUser(DictRecord):
+    fields = ('login', 'id', 'avatar_url')
+
+
+class DictLabel(DictRecord):
+    fields = ('id', 'url', 'name', 'color')
+
+
+class DictRepository(DictRecord):
+    fields = ('id', 'name', 'full_name', 'private', 'topics')
+
+
+class DictIssue(DictRecord):
+    fields = (
+        'id', 'title', 'url', 'repository_url', 'html_url', 'user', 'labels', 'state', 'locked', 'assignee',
+        'created_at', 'updated_at', 'closed_at', 'repository',
+    )
+    timestamps = ('created_at', 'updated_at', 'closed_at')
+    nested = {'user': DictUser, 'assignee': DictUser, 'labels': DictLabel}
+
+
+class DictPullRequest(DictRecord):
+    fields = (
+        'id', 'node_id', 'url', 'html_url', 'state', 'locked', 'title', 'user', 'body', 'created_at', 'updated_at',
+        'closed_at', 'merged_at', 'merged', 'repository',
+    )
+    timestamps = ('created_at', 'updated_at', 'closed_at', 'merged_at')
+    nested = {'user': DictUser}
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks hot paths of the leaderboard. Rows created for it are rolled back.'
+    subjects = ('serializers', 'rescore', 'webhooks', 'payloads')
+
+    def add_arguments(self, parser):
+        parser.add_argument('subject', choices=self.subjects)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--payload-size', type=int, default=1024 * 1024, help='Bytes of webhook payload.')
+        parser.add_argument('--payloads', type=int, default=1000, help='Webhook payloads to read.')
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['subject']}")(**options)
+
+    def report(self, name: str, seconds: float, baseline: float = None):
+        line = f'{name:<32} {seconds * 1000:10.1f} ms'
+        if baseline:
+            line += f'  {baseline / seconds:5.1f}x'
+        self.stdout.write(line)
+
+    def report_memory(self, name: str, function, retained: bool = False):
+        """
+        Reports the memory `function` allocated at peak, or what its result still holds when `retained`.
+        """
+        tracemalloc.start()
+        try:
+            result = function()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if retained:
+            self.stdout.write(f'{name:<32} {current / 1024 / 1024:10.1f} MiB retained')
+        else:
+            self.stdout.write(f'{name:<32} {peak / 1024 / 1024:10.1f} MiB allocated at peak')
+        return result
+
+    def best_of(self, function, repeat: int) -> float:
+        return min(timeit.repeat(function, number=1, repeat=repeat))
+
+    @staticmethod
+    def create_contributors(count: int):
+        rnd = random.Random(count)
+        now = datetime.now(timezone.utc)
+        repository = Repository.objects.create(id=FIRST_ID, name='benchmark')
+        labels = [
+            Label.objects.get_or_create(name=f'benchmark-{points}', defaults={'color': 'ffffff', 'points': points})[0]
+            for points in (0, 5, 10)
+        ]
+        users = GithubUser.objects.bulk_create([
+            GithubUser(id=FIRST_ID + i, username=f'benchmark{i}', avatar_url='https://avatars.githubusercontent.com/')
+            for i in range(count)
+        ])
+        issues, pull_requests, issue_labels = [], [], []
+        for user in users:
+            for _ in range(rnd.randint(0, 6)):
+                pull_request = PullRequest(
+                    id=FIRST_ID + len(pull_requests), url='https://api.github.com/', html_url='https://github.com/',
+                    title='Benchmark pull request', body='', state='closed', created_at=now, updated_at=now,
+                    merged_at=now, merged=True, user=user, repository=repository,
+                )
+                pull_requests.append(pull_request)
+                issue = Issue(
+                    id=FIRST_ID + len(issues), title='Benchmark issue', url='https://api.github.com/',
+                    repository=repository, state='closed', created_at=now, updated_at=now, closed_at=now,
+                    user=rnd.choice(users), pr=pull_request,
+                )
+                issues.append(issue)
+                issue_labels += [
+                    Issue.labels.through(issue_id=issue.id, label_id=label.name)
+                    for label in rnd.sample(labels, rnd.randint(1, 2))
+                ]
+        PullRequest.objects.bulk_create(pull_requests)
+        Issue.objects.bulk_create(issues)
+        Issue.labels.through.objects.bulk_create(issue_labels)
+        create_scores(GithubUser.objects.filter(id__gte=FIRST_ID).with_points())
+
+    def bench_serializers(self, users: int, repeat: int, **options):
+        with transaction.atomic():
+            self.create_contributors(users)
+            queryset = GithubUser.objects.filter(id__gte=FIRST_ID).scored().with_contributions()
+
+            def drf():
+                return JSONRenderer().render(GithubUserSerializer(queryset.all(), many=True).data)
+
+            def fast():
+                return render_contributors(queryset.all())
+
+            self.stdout.write(f'{users} contributors, {len(fast()) / 1024:.0f} KiB of JSON')
+            baseline = self.best_of(drf, repeat)
+            self.report('GithubUserSerializer', baseline)
+            self.report('fast_serializers', self.best_of(fast, repeat), baseline)
+            transaction.set_rollback(True)
+
+    def bench_rescore(self, users: int, repeat: int, **options):
+        with transaction.atomic():
+            self.create_contributors(users)
+            contributors = GithubUser.objects.filter(id__gte=FIRST_ID)
+            label = Label.objects.get(name='benchmark-10')
+            self.stdout.write(
+                f'{Issue.objects.filter(id__gte=FIRST_ID).count()} issues, '
+                f'{labelled_contributors([label.name]).count()} of {users} contributors labelled {label.name}'
+            )
+
+            def rebuild():
+                ContributorScore.objects.filter(user__in=contributors).delete()
+                create_scores(contributors.with_points())
+                rebuild_rollups(contributors)
+
+            def rescore():
+                # what the worker does for the rescoring a label save queues
+                label.points += 1
+                Label.objects.filter(pk=label.pk).update(points=label.points)
+                return rescore_contributors(labelled_contributors([label.name]))
+
+            rebuild()
+            baseline = self.best_of(rebuild, repeat)
+            self.report('rebuild every score', baseline)
+            self.report('rescore after a label change', self.best_of(rescore, repeat), baseline)
+            self.stdout.write(f'{rescore()}')
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def webhook_payload(size: int) -> bytes:
+        """
+        A `pull_request` event padded with commits up to about `size` bytes, non-ASCII text included.
+        """
+        rnd = random.Random(size)
+        payload = {
+            'action': 'closed',
+            'pull_request': {'id': FIRST_ID, 'title': 'Ajoute le tri à bulles ✨', 'body': 'Fixes #1\r\n' * 100},
+            'repository': {'id': FIRST_ID, 'name': 'benchmark', 'topics': []},
+            'commits': [],
+        }
+        body = b''
+        while len(body) < size:
+            payload['commits'] += [
+                {'id': f'{rnd.getrandbits(160):040x}', 'message': 'Corrige la lecture des entrées — ünïcödé ✓'}
+                for _ in range(100)
+            ]
+            body = json.dumps(payload, ensure_ascii=False).encode()
+        return body
+
+    def bench_webhooks(self, payload_size: int, repeat: int, **options):
+        body = self.webhook_payload(payload_size)
+        secret = GITHUB_WEBHOOK_SECRET.encode()
+        headers = {
+            'X-Hub-Signature-256': f'sha256={hmac.new(secret, body, hashlib.sha256).hexdigest()}',
+            'X-Hub-Signature': f'sha1={hmac.new(secret, body, hashlib.sha1).hexdigest()}',
+        }
+
+        def decoded():
+            # the body decoded to `str`, then encoded again to be verified and hashed
+            text = codecs.getreader('utf-8')(BytesIO(body)).read()
+            data = json.loads(text)
+            signature = headers['X-Hub-Signature'].split('=')[1]
+            assert signature == hmac.new(secret, text.encode(), hashlib.sha1).hexdigest()
+            hashlib.sha256(text.encode()).hexdigest()
+            return data
+
+        def raw():
+            request = SimpleNamespace(headers=headers)
+            data = JSONParser().parse(BytesIO(body), parser_context={'request': request})
+            assert GithubWebhookListenerView.verify_webhook(request)
+            hashlib.sha256(request.raw_body).hexdigest()
+            return data
+
+        assert decoded() == raw()
+        self.stdout.write(f'{len(body) / 1024:.0f} KiB payload')
+        baseline = self.best_of(decoded, repeat)
+        self.report('decode, verify and hash str', baseline)
+        self.report('parse, verify and hash bytes', self.best_of(raw, repeat), baseline)
+        self.report_memory('decode, verify and hash str', decoded)
+        self.report_memory('parse, verify and hash bytes', raw)
+
+    @staticmethod
+    def webhook_corpus(count: int) -> list:
+        """
+        `issues` and `pull_request` events with every field GitHub sends, which data models mostly ignore.
+        """
+        rnd = random.Random(count)
+
+        def timestamp() -> str:
+            return datetime.fromtimestamp(rnd.randint(1.5e9, 1.7e9), timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        def user(id: int) -> dict:
+            url = f'https://api.github.com/users/benchmark{id}'
+            return {
+                'login': f'benchmark{id}', 'id': FIRST_ID + id, 'node_id': f'MDQ6VXNlcj{id}',
+                'avatar_url': f'https://avatars.githubusercontent.com/u/{id}?v=4', 'gravatar_id': '', 'url': url,
+                'html_url': f'https://github.com/benchmark{id}', 'type': 'User', 'site_admin': False,
+                **{f'{name}_url': f'{url}/{name}' for name in (
+                    'followers', 'following', 'gists', 'starred', 'subscriptions', 'organizations', 'repos',
+                    'events', 'received_events',
+                )},
+            }
+
+        repository_url = 'https://api.github.com/repos/iiitv/benchmark'
+        repository = {
+            'id': FIRST_ID, 'node_id': 'MDEwOlJlcG9zaXRvcnk', 'name': 'benchmark', 'full_name': 'iiitv/benchmark',
+            'private': False, 'owner': user(0), 'html_url': 'https://github.com/iiitv/benchmark', 'fork': False,
+            'description': 'Benchmark repository', 'url': repository_url, 'created_at': timestamp(),
+            'updated_at': timestamp(), 'pushed_at': timestamp(), 'homepage': None, 'size': 1024,
+            'stargazers_count': 42, 'watchers_count': 42, 'language': 'Python', 'forks_count': 7,
+            'open_issues_count': 3, 'default_branch': 'main', 'topics': ['contribute', 'hacktoberfest'],
+            'visibility': 'public', 'has_issues': True, 'has_projects': True, 'has_wiki': True,
+            **{f'{name}_url': f'{repository_url}/{name}' for name in (
+                'forks', 'keys', 'collaborators', 'teams', 'hooks', 'issue_events', 'events', 'assignees',
+                'branches', 'tags', 'blobs', 'git_tags', 'git_refs', 'trees', 'statuses', 'languages',
+                'stargazers', 'contributors', 'subscribers', 'subscription', 'commits', 'git_commits', 'comments',
+                'issue_comment', 'contents', 'compare', 'merges', 'archive', 'downloads', 'issues', 'pulls',
+                'milestones', 'notifications', 'labels', 'releases', 'deployments',
+            )},
+        }
+        labels = [
+            {'id': FIRST_ID + i, 'node_id': f'LA_{i}', 'url': f'{repository_url}/labels/{name}', 'name': name,
+             'color': 'ffffff', 'default': False, 'description': f'{name} contribution'}
+            for i, name in enumerate(('feature', 'bug', 'documentation', 'good first issue'))
+        ]
+        corpus = []
+        for i in range(count):
+            author, reviewer = user(rnd.randint(1, 50)), user(rnd.randint(1, 50))
+            common = {
+                'id': FIRST_ID + i, 'node_id': f'I_{i}', 'number': i, 'title': 'Benchmark contribution',
+                'user': author, 'state': rnd.choice(['open', 'closed']), 'locked': False, 'assignee': reviewer,
+                'assignees': [reviewer], 'milestone': None, 'comments': rnd.randint(0, 20),
+                'created_at': timestamp(), 'updated_at': timestamp(), 'closed_at': rnd.choice([None, timestamp()]),
+                'author_association': 'CONTRIBUTOR', 'body': 'Adds a benchmark.\r\n' * rnd.randint(1, 40),
+                'html_url': f'https://github.com/iiitv/benchmark/issues/{i}',
+            }
+            if i % 2:
+                url = f'{repository_url}/pulls/{i}'
+                corpus.append({'action': 'closed', 'number': i, 'repository': repository, 'sender': author,
+                               'pull_request': {
+                                   **common, 'url': url, 'merged': True, 'merged_at': timestamp(), 'draft': False,
+                                   'merge_commit_sha': f'{rnd.getrandbits(160):040x}', 'requested_reviewers': [],
+                                   'head': {'ref': 'feature', 'sha': f'{rnd.getrandbits(160):040x}', 'user': author},
+                                   'base': {'ref': 'main', 'sha': f'{rnd.getrandbits(160):040x}', 'repo': repository},
+                                   'commits': rnd.randint(1, 10), 'additions': rnd.randint(1, 500),
+                                   'deletions': rnd.randint(0, 100), 'changed_files': rnd.randint(1, 20),
+                                   **{f'{name}_url': f'{url}/{name}' for name in (
+                                       'diff', 'patch', 'issue', 'commits', 'review_comments', 'comments', 'statuses',
+                                   )},
+                               }})
+            else:
+                url = f'{repository_url}/issues/{i}'
+                corpus.append({'action': 'labeled', 'repository': repository, 'sender': author, 'issue': {
+                    **common, 'url': url, 'repository_url': repository_url, 'labels': rnd.sample(labels, 2),
+                    'reactions': {'url': f'{url}/reactions', 'total_count': 0, '+1': 0, '-1': 0, 'laugh': 0},
+                    **{f'{name}_url': f'{url}/{name}' for name in ('labels', 'comments', 'events', 'timeline')},
+                }})
+        return corpus
+
+    def bench_payloads(self, payloads: int, repeat: int, **options):
+        corpus = self.webhook_corpus(payloads)
+        self.stdout.write(f'{payloads} issues and pull_request events')
+
+        def read_dicts():
+            return [
+                DictPullRequest(**data['pull_request'], parent_data=data) if 'pull_request' in data
+                else DictIssue(**data['issue'], parent_data=data)
+                for data in corpus
+            ]
+
+        def read():
+            return [
+                (PullRequestData if 'pull_request' in data else IssueData).from_dict(data) for data in corpus
+            ]
+
+        baseline = self.best_of(read_dicts, repeat)
+        self.report('dict records, dateutil', baseline)
+        self.report('data models', self.best_of(read, repeat), baseline)
+        self.report_memory('dict records, dateutil', read_dicts, retained=True)
+        self.report_memory('data models', read, retained=True)
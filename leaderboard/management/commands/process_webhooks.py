@@ -0,0 +1,51 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from multiprocessing import get_context
+
+import django
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from leaderboard.webhooks import WebhookWorker, requeue_stale
+
+
+class Command(BaseCommand):
+    help = 'Processes queued GitHub webhook deliveries, applying the events of an entity in the order they came.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Deliveries processed at the same time.')
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Process deliveries in a pool of processes instead of threads.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is drained instead of waiting for new deliveries.',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls of an idle queue.')
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help='Seconds after which deliveries left processing by a dead worker are queued again.',
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale(timedelta(seconds=options['stale_after']))
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Queued {requeued} stale delivery(ies) again'))
+
+        if connection.vendor == 'sqlite' and options['workers'] > 1:
+            self.stdout.write(self.style.WARNING(
+                'SQLite lets one worker write at a time, deliveries failing on a locked database will be retried'
+            ))
+
+        if options['processes']:
+            # workers are started afresh rather than forked, which would share the database connection
+            # this process keeps using, and set Django up before taking any delivery
+            executor = ProcessPoolExecutor(
+                options['workers'], mp_context=get_context('spawn'), initializer=django.setup,
+            )
+        else:
+            executor = ThreadPoolExecutor(options['workers'], thread_name_prefix='webhook')
+        with executor:
+            WebhookWorker(executor, options['workers'], options['poll_interval']).run(once=options['once'])
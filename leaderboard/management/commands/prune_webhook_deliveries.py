@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from leaderboard.models import DeliveryStatus, WebhookDelivery
+
+
+class Command(BaseCommand):
+    help = 'Deletes processed webhook deliveries older than the retention period, keeping the delivery log small.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help='Days processed deliveries are kept, and redeliveries of them recognized, for.',
+        )
+
+    def handle(self, *args, **options):
+        deleted, _ = WebhookDelivery.objects.exclude(
+            status__in=(DeliveryStatus.QUEUED, DeliveryStatus.PROCESSING),
+        ).filter(
+            processed_at__lt=timezone.now() - timedelta(days=options['days']),
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} webhook delivery(ies)'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from leaderboard.models import ContributorScore, GithubUser
+from leaderboard.scoring import create_scores, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds contributor scores and daily rollups from scratch and reports drift from the live points.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report drift, without rebuilding the table.',
+        )
+
+    def handle(self, *args, **options):
+        # live points of everyone are computed by the database, in one query
+        drifted = GithubUser.objects.with_points().filter(
+            ~Q(score__total=F('computed_points')),
+        ).order_by('id').values_list('id', 'username', 'score__total', 'computed_points')
+        for id, username, stored, live in drifted:
+            self.stdout.write(self.style.WARNING(f'{username} ({id}): stored {stored}, live {live}'))
+        self.stdout.write(f'{len(drifted)} contributor(s) drifted from their live points')
+
+        if options['check']:
+            return
+
+        with transaction.atomic():
+            ContributorScore.objects.all().delete()
+            created = create_scores(GithubUser.objects.with_points())
+            rollups = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(created)} contributor score(s) and {rollups} daily rollup(s)'
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.21 on 2026-10-17 03:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0006_remove_pullrequest_labels'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContributorScore',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='leaderboard.githubuser')),
+                ('issue_points', models.IntegerField(default=0)),
+                ('pull_request_points', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('rank', models.IntegerField(blank=True, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='contributorscore',
+            index=models.Index(fields=['-total', 'user'], name='leaderboard_score_total_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.21 on 2026-10-17 04:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0007_contributorscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContributionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('issue_points', models.IntegerField(default=0)),
+                ('pull_request_points', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='leaderboard.githubuser')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='contributionrollup',
+            index=models.Index(fields=['day', 'user'], name='leaderboard_rollup_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='contributionrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='leaderboard_rollup_user_day_unique'),
+        ),
+    ]
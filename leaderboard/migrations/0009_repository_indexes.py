@@ -0,0 +1,21 @@
+# Generated by Django 3.2.21 on 2026-10-17 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0008_contributionrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['repository', 'user'], name='leaderboard_issue_repo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pullrequest',
+            index=models.Index(fields=['repository', 'merged', 'user'], name='leaderboard_pr_repo_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.21 on 2026-10-17 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0010_webhookdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookdelivery',
+            name='delivery_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='webhookdelivery',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
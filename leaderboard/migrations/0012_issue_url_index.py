@@ -0,0 +1,17 @@
+# Generated by Django 3.2.21 on 2026-10-17 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0011_webhookdelivery_delivery_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['url'], name='leaderboard_issue_url_idx'),
+        ),
+    ]
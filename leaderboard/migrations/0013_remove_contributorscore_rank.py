@@ -0,0 +1,17 @@
+# Generated by Django 3.2.21 on 2026-10-17 04:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0012_issue_url_index'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='contributorscore',
+            name='rank',
+        ),
+    ]
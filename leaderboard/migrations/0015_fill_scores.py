@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def fill_scores(apps, schema_editor):
+    # points are computed by the querysets of the current models, which historical models lack
+    from leaderboard.models import GithubUser
+    from leaderboard.scoring import create_scores, rebuild_rollups
+
+    create_scores(GithubUser.objects.with_points().filter(score__isnull=True))
+    rebuild_rollups()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0014_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
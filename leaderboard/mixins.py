@@ -1,4 +1,12 @@
-from rest_framework.exceptions import MethodNotAllowed
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .caching import current_version, make_etag, get_response, set_response
 
 
 class ReadOnlySerializerMixin:
@@ -7,3 +15,97 @@ class ReadOnlySerializerMixin:
 
     def create(self, validated_data):
         raise MethodNotAllowed('create')
+
+
+class DynamicFieldsSerializerMixin:
+    """
+    Takes an optional `fields` argument, leaving out every other field of the serializer.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class VersionedCacheMixin:
+    """
+    Caches rendered GET responses until the scores version is bumped by a webhook, and answers
+    matching `If-None-Match` requests with 304 Not Modified. The version is the one this process
+    read last, so neither of them touches the database.
+    """
+
+    def get_etag_parts(self, request) -> 'list[str]':
+        """
+        Everything besides the scores version the response depends on.
+        """
+        return [request.build_absolute_uri(), request.accepted_media_type]
+
+    def get(self, request, *args, **kwargs):
+        etag = make_etag(current_version(), *self.get_etag_parts(request))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        cached = get_response(etag)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            return response
+
+        response = self.finalize_response(request, super().get(request, *args, **kwargs), *args, **kwargs)
+        if response.streaming:
+            response['ETag'] = etag
+            return response
+        if isinstance(response, Response):
+            response.render()
+        if response.status_code == status.HTTP_200_OK:
+            set_response(etag, response.content, response['Content-Type'])
+            response['ETag'] = etag
+        return response
+
+
+class StreamingListMixin:
+    """
+    Streams the whole list as a JSON array when `?stream=true` is given, serializing
+    `stream_chunk_size` rows at a time, so the first bytes go out right away and memory stays
+    flat however long the list is. Streams are not paginated, so asking for a page of one is an error.
+    """
+    stream_query_param = 'stream'
+    stream_chunk_size = 200
+
+    def is_streaming(self, request) -> bool:
+        return request.query_params.get(self.stream_query_param) in ('1', 'true')
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_streaming(request):
+            return super().list(request, *args, **kwargs)
+        if self.paginator is not None and self.paginator.is_requested(request):
+            raise ValidationError(f'{self.stream_query_param} cannot be combined with pagination')
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(self.stream(queryset), content_type='application/json')
+
+    def stream(self, queryset):
+        # iterator() skips prefetch_related lookups, so they are applied to every chunk instead
+        lookups = queryset._prefetch_related_lookups
+        renderer = JSONRenderer()
+        separator = b'['
+        chunk = []
+        for instance in queryset.prefetch_related(None).iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(instance)
+            if len(chunk) == self.stream_chunk_size:
+                yield separator + self.render_chunk(renderer, chunk, lookups)
+                separator = b','
+                chunk = []
+        if chunk:
+            yield separator + self.render_chunk(renderer, chunk, lookups)
+            separator = b','
+        yield b'[]' if separator == b'[' else b']'
+
+    def render_chunk(self, renderer: JSONRenderer, chunk: list, lookups) -> bytes:
+        prefetch_related_objects(chunk, *lookups)
+        data = self.get_serializer(chunk, many=True).data
+        # an array rendered without its brackets
+        return renderer.render(data)[1:-1]
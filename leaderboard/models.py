@@ -1,5 +1,10 @@
+from datetime import date
+from typing import Optional
+
 from django.db import models
-from django.db.models import QuerySet, Subquery, OuterRef, Sum, F
+from django.db.models import QuerySet, Subquery, OuterRef, Sum, F, Exists, Case, When, Q, Window, Prefetch
+from django.db.models.functions import Coalesce, Rank
+from django.utils import timezone
 
 
 class States(models.TextChoices):
@@ -7,21 +12,229 @@ class States(models.TextChoices):
     CLOSED = 'closed'
 
 
+class DeliveryStatus(models.TextChoices):
+    QUEUED = 'queued'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+
+
+class IssueQuerySet(models.QuerySet):
+
+    def considered(self):
+        """
+        Issues listed in a contributor's contributions, see `GithubUser.issues`.
+        """
+        labels_points = Issue.labels.through.objects.filter(
+            issue_id=OuterRef('pk'),
+        ).values('issue_id').annotate(
+            points_sum=Sum('label__points'),
+        ).values('points_sum')
+        return self.filter(
+            repository__consider_contributions=True,
+        ).alias(
+            labels_points=Subquery(labels_points),
+        ).filter(
+            labels_points__gt=0,
+        )
+
+    def with_points(self):
+        """
+        Annotates `computed_points` following the `Issue.points` rule: an issue is worth its
+        opening points as soon as one of its labels carries positive points.
+        """
+        feature_labels = Issue.labels.through.objects.filter(
+            issue_id=OuterRef('pk'),
+            label__points__gt=0,
+        )
+        return self.annotate(
+            computed_points=Case(
+                When(Exists(feature_labels), then=F('issue_opening_points')),
+                default=0,
+                output_field=models.IntegerField(),
+            )
+        )
+
+
+class PullRequestQuerySet(models.QuerySet):
+
+    def considered(self):
+        """
+        Pull requests listed in a contributor's contributions, see `GithubUser.pull_requests`.
+        """
+        return self.filter(
+            repository__consider_contributions=True,
+            merged=True,
+        )
+
+    def with_points(self):
+        """
+        Annotates `computed_points` following the `PullRequest.points` rule: a merged pull request
+        is worth the label points of its linked issues, plus its merge points if those are non zero.
+        """
+        linked_labels_points = Issue.labels.through.objects.filter(
+            issue__pr_id=OuterRef('pk'),
+        ).values('issue__pr_id').annotate(
+            points_sum=Sum('label__points'),
+        ).values('points_sum')
+        return self.alias(
+            linked_labels_points=Coalesce(Subquery(linked_labels_points), 0),
+        ).annotate(
+            computed_points=Case(
+                When(
+                    Q(merged=True) & ~Q(linked_labels_points=0),
+                    then=F('linked_labels_points') + F('merge_points'),
+                ),
+                default=0,
+                output_field=models.IntegerField(),
+            )
+        )
+
+
+class GithubUserQuerySet(models.QuerySet):
+
+    def with_points(self, repository_id: Optional[int] = None):
+        """
+        Annotates `issue_points`, `pull_request_points` and their sum `computed_points`, matching
+        `GithubUser.points` in a single query. When given, only contributions to the repository
+        with `repository_id` are counted.
+        """
+        issues = Issue.objects.all()
+        pull_requests = PullRequest.objects.all()
+        if repository_id is not None:
+            issues = issues.filter(repository_id=repository_id)
+            pull_requests = pull_requests.filter(repository_id=repository_id)
+        issue_points = issues.with_points().filter(
+            user_id=OuterRef('pk'),
+        ).values('user_id').annotate(
+            points_sum=Sum('computed_points'),
+        ).values('points_sum')
+        pull_request_points = pull_requests.with_points().filter(
+            user_id=OuterRef('pk'),
+        ).values('user_id').annotate(
+            points_sum=Sum('computed_points'),
+        ).values('points_sum')
+        return self.annotate(
+            issue_points=Coalesce(Subquery(issue_points), 0),
+            pull_request_points=Coalesce(Subquery(pull_request_points), 0),
+        ).annotate(
+            computed_points=F('issue_points') + F('pull_request_points'),
+        )
+
+    def ranked(self):
+        """
+        Orders users by points, highest first, and annotates their `rank`. Tied users share a rank.
+        """
+        return self.with_points().annotate(
+            rank=Window(expression=Rank(), order_by=F('computed_points').desc()),
+        ).order_by('-computed_points', 'id')
+
+    def with_contributions(
+            self,
+            start: Optional[date] = None,
+            end: Optional[date] = None,
+            repository_id: Optional[int] = None,
+            issues: bool = True,
+            pull_requests: bool = True,
+    ):
+        """
+        Prefetches the issues and pull requests listed by `GithubUserSerializer`, with their points,
+        repository and feature labels, so serializing any number of users costs a fixed number of queries.
+        When given, only contributions made between `start` and `end` included, or to the repository
+        with `repository_id`, are listed. Issues or pull requests which will not be serialized can
+        be left out with `issues` and `pull_requests`.
+        """
+        lookups = []
+        if issues:
+            queryset = Issue.objects.considered()
+            if repository_id is not None:
+                queryset = queryset.filter(repository_id=repository_id)
+            if start and end:
+                queryset = queryset.filter(created_at__date__range=(start, end))
+            lookups.append(Prefetch(
+                'issue_set',
+                queryset=queryset.with_points().select_related('repository').prefetch_related(
+                    Prefetch(
+                        'labels',
+                        queryset=Label.objects.filter(points__gt=0).order_by('name'),
+                        to_attr='prefetched_feature_labels',
+                    ),
+                ),
+                to_attr='prefetched_issues',
+            ))
+        if pull_requests:
+            queryset = PullRequest.objects.considered()
+            if repository_id is not None:
+                queryset = queryset.filter(repository_id=repository_id)
+            if start and end:
+                queryset = queryset.filter(merged_at__date__range=(start, end))
+            lookups.append(Prefetch(
+                'pullrequest_set',
+                queryset=queryset.with_points().select_related('repository'),
+                to_attr='prefetched_pull_requests',
+            ))
+        return self.prefetch_related(*lookups)
+
+    def ranked_in(self, repository_id: int):
+        """
+        Orders users by the points of their contributions to one repository, highest first. Users
+        without points in that repository are left out.
+        """
+        return self.with_points(repository_id).filter(
+            computed_points__gt=0,
+        ).order_by('-computed_points', 'id')
+
+    def ranked_between(self, start: date, end: date):
+        """
+        Orders users by the points of their contributions made between `start` and `end` included,
+        summed from the daily rollups. Users without points in that window are left out.
+        """
+        return self.filter(
+            rollups__day__range=(start, end),
+        ).annotate(
+            issue_points=Sum('rollups__issue_points'),
+            pull_request_points=Sum('rollups__pull_request_points'),
+        ).annotate(
+            computed_points=F('issue_points') + F('pull_request_points'),
+        ).filter(
+            computed_points__gt=0,
+        ).order_by('-computed_points', 'id')
+
+    def scored(self):
+        """
+        Reads points from the denormalized `ContributorScore` table, highest points first. Every user
+        gets a score row when created, so the score is joined rather than outer joined, and the
+        ordering is on score columns for `leaderboard_score_total_idx` to walk instead of sorting.
+        """
+        return self.filter(score__isnull=False).select_related('score').annotate(
+            issue_points=F('score__issue_points'),
+            pull_request_points=F('score__pull_request_points'),
+            computed_points=F('score__total'),
+        ).order_by('-score__total', 'score__user')
+
+
 class GithubUser(models.Model):
     id = models.IntegerField(primary_key=True)
     avatar_url = models.CharField(max_length=255)
     username = models.CharField(max_length=255)
 
+    objects = GithubUserQuerySet.as_manager()
+
     def __str__(self):
         return self.username
 
     @property
     def points(self):
+        if hasattr(self, 'computed_points'):
+            return self.computed_points
         points = sum([issue.points for issue in self.issue_set.all()])
         points += sum([pr.points for pr in self.pullrequest_set.all()])
         return points
 
     def issues(self) -> QuerySet['Issue']:
+        if hasattr(self, 'prefetched_issues'):
+            return self.prefetched_issues
         return self.issue_set.filter(
             repository__consider_contributions=True,
         ).annotate(
@@ -31,6 +244,8 @@ class GithubUser(models.Model):
         )
 
     def pull_requests(self):
+        if hasattr(self, 'prefetched_pull_requests'):
+            return self.prefetched_pull_requests
         return self.pullrequest_set.filter(
             repository__consider_contributions=True,
             merged=True,
@@ -68,13 +283,30 @@ class Issue(models.Model):
     issue_opening_points = models.IntegerField(default=10)
     pr = models.ForeignKey('PullRequest', on_delete=models.CASCADE, null=True, blank=True)
 
+    objects = IssueQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['repository', 'user'], name='leaderboard_issue_repo_idx'),
+            # closing references of pull requests are resolved by url
+            models.Index(fields=['url'], name='leaderboard_issue_url_idx'),
+        ]
+
     @property
-    def feature_labels(self):
-        return self.labels.filter(points__gt=0)
+    def feature_labels(self) -> 'list[Label]':
+        if hasattr(self, 'prefetched_feature_labels'):
+            return self.prefetched_feature_labels
+        # the labels carry their points, so the registry is not needed to tell which of them score
+        return sorted(
+            (label for label in self.labels.all() if label.points > 0),
+            key=lambda label: label.name,
+        )
 
     @property
     def points(self):
-        if not self.feature_labels.aggregate(Sum('points'))['points__sum']:
+        if hasattr(self, 'computed_points'):
+            return self.computed_points
+        if not self.feature_labels:
             return 0
         return self.issue_opening_points
 
@@ -100,8 +332,17 @@ class PullRequest(models.Model):
 
     merge_points = models.IntegerField(default=10)
 
+    objects = PullRequestQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['repository', 'merged', 'user'], name='leaderboard_pr_repo_idx'),
+        ]
+
     @property
     def points(self):
+        if hasattr(self, 'computed_points'):
+            return self.computed_points
         points = 0
         if self.merged:
             points += self.issue_set.annotate(
@@ -121,3 +362,102 @@ class PullRequest(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class ContributorScore(models.Model):
+    user = models.OneToOneField(GithubUser, on_delete=models.CASCADE, primary_key=True, related_name='score')
+    issue_points = models.IntegerField(default=0)
+    pull_request_points = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total', 'user'], name='leaderboard_score_total_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.total}'
+
+
+class ContributionRollup(models.Model):
+    user = models.ForeignKey(GithubUser, on_delete=models.CASCADE, related_name='rollups')
+    day = models.DateField()
+    issue_points = models.IntegerField(default=0)
+    pull_request_points = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='leaderboard_rollup_user_day_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'user'], name='leaderboard_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} on {self.day}: {self.issue_points + self.pull_request_points}'
+
+
+class Version(models.Model):
+    """
+    Counter bumped by writes which invalidate what processes derived from the database, e.g. the
+    scores version. It is kept in the database so that every process, on every host, sees the bumps
+    of the others.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.key}: {self.value}'
+
+
+class WebhookDeliveryQuerySet(models.QuerySet):
+
+    def unfinished(self):
+        return self.filter(status__in=(DeliveryStatus.QUEUED, DeliveryStatus.PROCESSING))
+
+    def ready(self):
+        """
+        Queued deliveries due for processing, which no earlier unfinished delivery of the same entity
+        is waiting for, oldest first, so that the events of an entity are applied in the order GitHub
+        sent them.
+        """
+        earlier = WebhookDelivery.objects.unfinished().filter(
+            entity=OuterRef('entity'),
+            id__lt=OuterRef('id'),
+        )
+        return self.filter(
+            Q(retry_at__isnull=True) | Q(retry_at__lte=timezone.now()),
+            status=DeliveryStatus.QUEUED,
+        ).exclude(Exists(earlier)).order_by('id')
+
+
+class WebhookDelivery(models.Model):
+    # `X-GitHub-Delivery` header, the same for every redelivery of an event
+    delivery_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    # sha256 of the raw body, telling genuine redeliveries from reused delivery ids
+    payload_hash = models.CharField(max_length=64, blank=True)
+    event = models.CharField(max_length=255)
+    action = models.CharField(max_length=255, blank=True)
+    # deliveries of the same entity, e.g. `pull_request:42`, are processed one at a time, in order
+    entity = models.CharField(max_length=255)
+    payload = models.JSONField()
+    status = models.CharField(max_length=255, choices=DeliveryStatus.choices, default=DeliveryStatus.QUEUED)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = WebhookDeliveryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='leaderboard_delivery_status'),
+            models.Index(fields=['entity', 'id'], name='leaderboard_delivery_entity'),
+        ]
+        verbose_name_plural = 'webhook deliveries'
+
+    def __str__(self):
+        return f'{self.event} {self.action} {self.entity}'.replace('  ', ' ')
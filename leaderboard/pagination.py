@@ -0,0 +1,127 @@
+from base64 import b64decode, b64encode
+from typing import Optional, Tuple
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ContributorCursorPagination(BasePagination):
+    """
+    Keyset pagination over contributors ordered by points (highest first) then id.
+
+    The cursor holds the (points, id) of the last contributor of a page, and the next page starts
+    right after it with a range condition, so no page is ever reached through an OFFSET
+    scan. Responses are only paginated when `limit` or `cursor` is given, the full list is returned
+    otherwise.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 50
+    max_limit = 100
+    points_attribute = 'computed_points'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.base_url = None
+        self.next_position = None
+
+    def is_requested(self, request) -> bool:
+        return self.cursor_query_param in request.query_params or self.limit_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        limit = self.get_limit(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            points, id = position
+            points_field, id_field = self.get_ordering(queryset)
+            queryset = queryset.filter(
+                Q(**{f'{points_field}__lt': points}) | Q(**{points_field: points, f'{id_field}__gt': id})
+            )
+
+        results = list(queryset[:limit + 1])
+        self.next_position = None
+        if len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            self.next_position = (getattr(last, self.points_attribute), last.id)
+        return results
+
+    def get_ordering(self, queryset) -> Tuple[str, str]:
+        # the range condition is on the very fields the queryset is ordered by, so that an index
+        # serving the order serves the range too
+        points_ordering, id_ordering = queryset.query.order_by
+        return points_ordering.lstrip('-'), id_ordering
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return min(max(limit, 1), self.max_limit)
+
+    def decode_cursor(self, request) -> Optional[Tuple[int, int]]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            points, id = b64decode(encoded.encode('ascii'), validate=True).decode('ascii').split(':')
+            return int(points), int(id)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position: Tuple[int, int]) -> str:
+        points, id = position
+        encoded = b64encode(f'{points}:{id}'.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {
+                    'type': 'string',
+                },
+            },
+            {
+                'name': self.limit_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of contributors to return per page, at most {self.max_limit}.',
+                'schema': {
+                    'type': 'integer',
+                },
+            },
+        ]
@@ -0,0 +1,143 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Type
+
+from django.db import transaction
+from django.db.models import Model
+
+from .models import GithubUser, Repository, Label, PullRequest, Issue
+
+_local = threading.local()
+
+IdentityMap = Dict[Type[Model], Dict[Any, Model]]
+
+
+def current_identity_map() -> Optional[IdentityMap]:
+    return getattr(_local, 'identity_map', None)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Shares one identity map between the batches written inside, so that every row of an ingest is
+    read or written at most once however many payloads mention it. Nested calls join the outermost
+    unit of work.
+    """
+    identity_map = current_identity_map()
+    if identity_map is not None:
+        yield identity_map
+        return
+
+    _local.identity_map = identity_map = defaultdict(dict)
+    try:
+        yield identity_map
+    finally:
+        _local.identity_map = None
+
+
+class UpsertBatch:
+    """
+    Collects the rows of a payload and writes them with one read, at most one insert and one
+    update per model, instead of a `get_or_create` or `update_or_create` round trip per row.
+
+    Rows are given by primary key with their field values, foreign keys as `<name>_id`. Existing
+    rows are only updated when one of their values changed, and not at all when added with
+    `update=False`. Many-to-many links given with `set_links` replace the current ones, like
+    `RelatedManager.set`. Inside `unit_of_work`, rows already read or written by an earlier batch
+    are not read again.
+    """
+    # writes follow foreign keys
+    models = (GithubUser, Repository, Label, PullRequest, Issue)
+
+    def __init__(self, identity_map: Optional[IdentityMap] = None):
+        if identity_map is None:
+            identity_map = current_identity_map()
+        self.instances: IdentityMap = defaultdict(dict) if identity_map is None else identity_map
+        self._rows: Dict[Type[Model], Dict[Any, Dict[str, Any]]] = defaultdict(dict)
+        self._updated: Dict[Type[Model], Set[Any]] = defaultdict(set)
+        self._links: Dict[Any, Dict[Any, List[Any]]] = defaultdict(dict)
+        self.created: Dict[Type[Model], List[Model]] = defaultdict(list)
+
+    def add(self, model: Type[Model], pk, fields: Dict[str, Any], update: bool = True):
+        self._rows[model].setdefault(pk, {}).update(fields)
+        if update:
+            self._updated[model].add(pk)
+
+    def set_links(self, related, pk, target_pks: Iterable):
+        """
+        Makes the rows linked to `pk` through the many-to-many descriptor `related` exactly `target_pks`.
+        """
+        self._links[related][pk] = list(dict.fromkeys(target_pks))
+
+    def get(self, model: Type[Model], pk) -> Model:
+        return self.instances[model][pk]
+
+    def flush(self):
+        with transaction.atomic():
+            for model in self.models:
+                if self._rows[model]:
+                    self._flush_model(model)
+            for related, links in self._links.items():
+                self._flush_links(related, links)
+        self._rows.clear()
+        self._updated.clear()
+        self._links.clear()
+
+    def _flush_model(self, model: Type[Model]):
+        rows = self._rows[model]
+        known = self.instances[model]
+        existing = {pk: known[pk] for pk in rows if pk in known}
+        unknown = [pk for pk in rows if pk not in known]
+        if unknown:
+            existing.update(model.objects.in_bulk(unknown))
+        created = [model(pk=pk, **fields) for pk, fields in rows.items() if pk not in existing]
+        changed = []
+        changed_fields = set()
+        for pk, instance in existing.items():
+            if pk not in self._updated[model]:
+                continue
+            fields = [name for name, value in rows[pk].items() if getattr(instance, name) != value]
+            for name in fields:
+                setattr(instance, name, rows[pk][name])
+            if fields:
+                changed.append(instance)
+                changed_fields.update(fields)
+
+        model.objects.bulk_create(created)
+        if changed:
+            model.objects.bulk_update(changed, sorted(changed_fields))
+        self.instances[model].update(existing)
+        self.instances[model].update((instance.pk, instance) for instance in created)
+        self.created[model] += created
+
+    @staticmethod
+    def _flush_links(related, links: Dict[Any, List[Any]]):
+        through = related.through
+        source = related.field.m2m_field_name()
+        target = related.field.m2m_reverse_field_name()
+        current = defaultdict(set)
+        for source_pk, target_pk in through.objects.filter(**{f'{source}__in': list(links)}).values_list(
+                f'{source}_id', f'{target}_id'
+        ):
+            current[source_pk].add(target_pk)
+
+        removed = [
+            (source_pk, target_pk)
+            for source_pk, target_pks in current.items()
+            for target_pk in target_pks - set(links[source_pk])
+        ]
+        added = [
+            through(**{f'{source}_id': source_pk, f'{target}_id': target_pk})
+            for source_pk, target_pks in links.items()
+            for target_pk in target_pks
+            if target_pk not in current[source_pk]
+        ]
+        if removed:
+            removed_targets = defaultdict(list)
+            for source_pk, target_pk in removed:
+                removed_targets[source_pk].append(target_pk)
+            for source_pk, target_pks in removed_targets.items():
+                through.objects.filter(**{f'{source}_id': source_pk, f'{target}_id__in': target_pks}).delete()
+        if added:
+            through.objects.bulk_create(added)
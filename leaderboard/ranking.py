@@ -0,0 +1,70 @@
+import threading
+from bisect import bisect_left, insort
+from typing import Iterable, List, Optional, Tuple
+
+from .caching import get_version
+from .models import ContributorScore
+
+
+class RankIndex:
+    """
+    Sorted array of contributor totals, answering "how many contributors have more points" with a
+    binary search instead of a `COUNT(*)` per request. Local writes move single totals in place,
+    and the array is rebuilt from `ContributorScore` whenever the scores version moved because of
+    writes it has not seen, such as the ones of other processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # negated totals, so that the highest total comes first
+        self._totals: List[int] = []
+        self._version: Optional[int] = None
+
+    def rebuild(self):
+        # version first: a write committed meanwhile only makes the index look older than it is
+        version = get_version()
+        totals = sorted(-total for total in ContributorScore.objects.values_list('total', flat=True))
+        with self._lock:
+            self._totals, self._version = totals, version
+
+    def rank(self, total: int) -> int:
+        """
+        Rank of a contributor with `total` points, tied contributors sharing the same rank.
+        """
+        if self._version != get_version():
+            self.rebuild()
+        return bisect_left(self._totals, -total) + 1
+
+    def move(self, changes: Iterable[Tuple[Optional[int], Optional[int]]]):
+        """
+        Replaces old totals by new ones, `None` standing for a contributor without score.
+        """
+        with self._lock:
+            if self._version is None:
+                return
+            for old, new in changes:
+                if old is not None:
+                    i = bisect_left(self._totals, -old)
+                    if i < len(self._totals) and self._totals[i] == -old:
+                        del self._totals[i]
+                if new is not None:
+                    insort(self._totals, -new)
+
+    def invalidate(self):
+        """
+        Leaves the index to be rebuilt on its next read, after writes changing too many totals to move.
+        """
+        with self._lock:
+            self._version = None
+
+    def advance(self, version: int):
+        """
+        Marks the index current for `version`, provided the write which bumped the version from the
+        one the index was current for has already been applied with `move`.
+        """
+        with self._lock:
+            if self._version == version - 1:
+                self._version = version
+
+
+rank_index = RankIndex()
@@ -0,0 +1,59 @@
+"""
+Issues a pull request closes, read from the closing keywords of its description as GitHub reads
+them: "Fixes #12", "closes org/repo#34" or "resolves https://github.com/org/repo/issues/56".
+"""
+import re
+from typing import Dict, Iterable, List, NamedTuple
+
+from .github import API_URL
+from .models import Issue
+
+CLOSING_REFERENCE = re.compile(
+    r'\b(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?):?[ \t]+(?:'
+    r'(?:(?P<owner>[\w-]+)/(?P<repository>[\w.-]+))?#(?P<number>\d+)'
+    r'|https://github\.com/(?P<url_owner>[\w-]+)/(?P<url_repository>[\w.-]+)/issues/(?P<url_number>\d+)'
+    r')\b',
+    re.IGNORECASE,
+)
+# GitHub does not read keywords in code or in comments, which pull request templates are full of
+IGNORED = re.compile(r'```.*?(?:```|$)|`[^`\n]*`|<!--.*?(?:-->|$)', re.DOTALL)
+PULL_REQUEST_URL = re.compile(rf'^{re.escape(API_URL)}/repos/(?P<owner>[\w-]+)/(?P<repository>[\w.-]+)/pulls/\d+$')
+
+
+class IssueReference(NamedTuple):
+    owner: str
+    repository: str
+    number: int
+
+    @property
+    def url(self) -> str:
+        # issues are stored with the url of the REST API
+        return f'{API_URL}/repos/{self.owner}/{self.repository}/issues/{self.number}'
+
+
+def closing_references(body: str, pull_request_url: str) -> List[IssueReference]:
+    """
+    References of the issues `body` closes, in order and without duplicates. Bare numbers refer to
+    the repository of the pull request, given by its REST API url.
+    """
+    match = PULL_REQUEST_URL.match(pull_request_url)
+    owner, repository = match.group('owner', 'repository') if match else (None, None)
+    references = []
+    for match in CLOSING_REFERENCE.finditer(IGNORED.sub('', body or '')):
+        if match['url_number']:
+            references.append(IssueReference(match['url_owner'], match['url_repository'], int(match['url_number'])))
+        elif match['owner']:
+            references.append(IssueReference(match['owner'], match['repository'], int(match['number'])))
+        elif owner:
+            references.append(IssueReference(owner, repository, int(match['number'])))
+    return list(dict.fromkeys(references))
+
+
+def resolve_references(references: Iterable[IssueReference]) -> Dict[IssueReference, Issue]:
+    """
+    Issues known locally among `references`, read in one query.
+    """
+    by_url = {reference.url: reference for reference in references}
+    if not by_url:
+        return {}
+    return {by_url[issue.url]: issue for issue in Issue.objects.filter(url__in=by_url)}
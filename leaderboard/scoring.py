@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple, Type, Union
+
+from django.db import connection, transaction
+from django.db.models import Model, Q, QuerySet, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .caching import bump_version
+from .models import ContributorScore, ContributionRollup, GithubUser, Issue, PullRequest
+from .ranking import rank_index
+from .snapshot import snapshot_store
+
+_local = threading.local()
+
+# day the points of a contribution are counted on in the daily rollups
+POINTS_DAY = {
+    Issue: TruncDate('created_at'),
+    PullRequest: TruncDate(Coalesce('merged_at', 'created_at')),
+}
+
+# daily points of issues and of pull requests, summed into one rollup per user and day
+INSERT_ROLLUPS_SQL = """
+INSERT INTO {rollup} (user_id, day, issue_points, pull_request_points)
+SELECT user_id, points_day, SUM(issue_points), SUM(pull_request_points) FROM (
+    SELECT user_id, points_day, points_sum AS issue_points, 0 AS pull_request_points
+    FROM ({issues}) issues
+    UNION ALL
+    SELECT user_id, points_day, 0 AS issue_points, points_sum AS pull_request_points
+    FROM ({pull_requests}) pull_requests
+) points
+GROUP BY user_id, points_day
+HAVING SUM(issue_points) <> 0 OR SUM(pull_request_points) <> 0
+"""
+
+# scores of some users set to the sum of their rollups, leaving unchanged ones alone
+UPDATE_SCORES_SQL = """
+UPDATE {score} SET
+    issue_points = totals.issue_points,
+    pull_request_points = totals.pull_request_points,
+    total = totals.issue_points + totals.pull_request_points,
+    last_updated = %s
+FROM (
+    SELECT score.user_id,
+        COALESCE(SUM(rollup.issue_points), 0) AS issue_points,
+        COALESCE(SUM(rollup.pull_request_points), 0) AS pull_request_points
+    FROM {score} score LEFT JOIN {rollup} rollup ON rollup.user_id = score.user_id
+    WHERE score.user_id IN ({users})
+    GROUP BY score.user_id
+) totals
+WHERE {score}.user_id = totals.user_id
+    AND ({score}.issue_points <> totals.issue_points OR {score}.pull_request_points <> totals.pull_request_points)
+"""
+
+
+class ScoreTracker:
+    """
+    Remembers the points of the issues and pull requests touched by a write, so that only the
+    difference has to be applied to `ContributorScore` and `ContributionRollup` once the write is done.
+    """
+
+    def __init__(self):
+        self._tracked: Dict[Type[Model], Set[int]] = defaultdict(set)
+        self._before: Dict[Tuple[Type[Model], int], Tuple[int, date, int]] = {}
+
+    @staticmethod
+    def _points(model: Type[Model], pks: Union[Iterable[int], QuerySet], lock: bool = False):
+        queryset = model.objects.with_points().filter(pk__in=pks)
+        if lock:
+            queryset = queryset.select_for_update().order_by('pk')
+        return queryset.annotate(
+            points_day=POINTS_DAY[model],
+        ).values_list('pk', 'user_id', 'points_day', 'computed_points')
+
+    def track(self, model: Type[Model], pks: Union[Iterable[int], QuerySet]):
+        """
+        Records the current points of `model` rows with the given primary keys. Rows which do not
+        exist yet count as zero points. Rows already tracked keep their first recorded value.
+
+        The rows are locked until the write commits, so that a concurrent write tracking them, e.g.
+        of an issue and of the pull request closing it, waits for this one and records their points
+        as this one left them, instead of applying the same difference a second time.
+        """
+        if not isinstance(pks, QuerySet):
+            pks = set(pks) - self._tracked[model]
+            if not pks:
+                return
+            self._tracked[model].update(pks)
+        for pk, user_id, day, points in self._points(model, pks, lock=True):
+            self._tracked[model].add(pk)
+            self._before.setdefault((model, pk), (user_id, day, points))
+
+    def deltas(self) -> Dict[Tuple[int, date], Tuple[int, int]]:
+        """
+        Returns the (issue points, pull request points) change of every affected user and day.
+        """
+        deltas = defaultdict(lambda: [0, 0])
+        for model, pks in self._tracked.items():
+            column = 0 if model is Issue else 1
+            after = {pk: (user_id, day, points) for pk, user_id, day, points in self._points(model, pks)}
+            for pk in pks:
+                before = self._before.get((model, pk))
+                if before:
+                    deltas[before[:2]][column] -= before[2]
+                if pk in after:
+                    deltas[after[pk][:2]][column] += after[pk][2]
+        return {key: tuple(delta) for key, delta in deltas.items() if any(delta)}
+
+    def apply(self):
+        deltas = self.deltas()
+        user_deltas = defaultdict(lambda: [0, 0])
+        for (user_id, _), (issue_delta, pull_request_delta) in deltas.items():
+            user_deltas[user_id][0] += issue_delta
+            user_deltas[user_id][1] += pull_request_delta
+        apply_deltas({user_id: tuple(delta) for user_id, delta in user_deltas.items() if any(delta)})
+        apply_rollup_deltas(deltas)
+
+
+def apply_deltas(deltas: Dict[int, Tuple[int, int]]):
+    """
+    Adds (issue points, pull request points) to the scores of the given users, and moves their
+    totals in the rank index once committed.
+    """
+    if not deltas:
+        return
+    scores = ContributorScore.objects.select_for_update().in_bulk(deltas.keys())
+    now = timezone.now()
+    changes = []
+    for user_id, (issue_delta, pull_request_delta) in deltas.items():
+        score = scores.get(user_id)
+        if score is None:
+            continue
+        old_total = score.total
+        score.issue_points += issue_delta
+        score.pull_request_points += pull_request_delta
+        score.total += issue_delta + pull_request_delta
+        score.last_updated = now
+        changes.append((old_total, score.total))
+    ContributorScore.objects.bulk_update(
+        scores.values(), ['issue_points', 'pull_request_points', 'total', 'last_updated'],
+    )
+
+    missing = [user_id for user_id in deltas if user_id not in scores]
+    if missing:
+        created = create_scores(GithubUser.objects.with_points().filter(pk__in=missing))
+        changes += [(None, score.total) for score in created]
+    transaction.on_commit(lambda: rank_index.move(changes))
+
+
+def apply_rollup_deltas(deltas: Dict[Tuple[int, date], Tuple[int, int]]):
+    """
+    Adds (issue points, pull request points) to the daily rollups of the given users and days.
+    """
+    if not deltas:
+        return
+    rollups = {
+        (rollup.user_id, rollup.day): rollup
+        for rollup in ContributionRollup.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in deltas},
+            day__in={day for _, day in deltas},
+        )
+        if (rollup.user_id, rollup.day) in deltas
+    }
+    created = []
+    for (user_id, day), (issue_delta, pull_request_delta) in deltas.items():
+        rollup = rollups.get((user_id, day))
+        if rollup is None:
+            created.append(ContributionRollup(
+                user_id=user_id, day=day, issue_points=issue_delta, pull_request_points=pull_request_delta,
+            ))
+            continue
+        rollup.issue_points += issue_delta
+        rollup.pull_request_points += pull_request_delta
+    ContributionRollup.objects.bulk_update(rollups.values(), ['issue_points', 'pull_request_points'])
+    ContributionRollup.objects.bulk_create(created)
+
+
+def create_scores(users: QuerySet) -> 'list[ContributorScore]':
+    """
+    Creates the score rows of users annotated by `GithubUserQuerySet.with_points`.
+    """
+    return ContributorScore.objects.bulk_create([
+        ContributorScore(
+            user_id=user.pk,
+            issue_points=user.issue_points,
+            pull_request_points=user.pull_request_points,
+            total=user.computed_points,
+        )
+        for user in users
+    ])
+
+
+def compile_queryset(queryset: QuerySet) -> Tuple[str, tuple]:
+    sql, params = queryset.query.sql_with_params()
+    return sql, tuple(params)
+
+
+def daily_points(model: Type[Model], users: Optional[QuerySet] = None) -> QuerySet:
+    """
+    Points of the issues or pull requests of `users`, or of everyone, summed per user and day.
+    """
+    contributions = model.objects.all() if users is None else model.objects.filter(user__in=users)
+    return contributions.with_points().annotate(
+        points_day=POINTS_DAY[model],
+    ).order_by().values('user_id', 'points_day').annotate(
+        points_sum=Sum('computed_points'),
+    ).values_list('user_id', 'points_day', 'points_sum')
+
+
+def rebuild_rollups(users: Optional[QuerySet] = None) -> int:
+    """
+    Recreates the daily rollups of `users`, or of everyone, from the live points of issues and pull
+    requests. The database sums them and inserts the rollups in one statement.
+    """
+    ContributionRollup.objects.filter(**({} if users is None else {'user__in': users})).delete()
+    issues, issue_params = compile_queryset(daily_points(Issue, users))
+    pull_requests, pull_request_params = compile_queryset(daily_points(PullRequest, users))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            INSERT_ROLLUPS_SQL.format(
+                rollup=connection.ops.quote_name(ContributionRollup._meta.db_table),
+                issues=issues,
+                pull_requests=pull_requests,
+            ),
+            issue_params + pull_request_params,
+        )
+        return cursor.rowcount
+
+
+class RescoreReport(NamedTuple):
+    users: int
+    changed: int
+    seconds: float
+
+
+def labelled_contributors(label_names: Iterable[str]) -> QuerySet:
+    """
+    Users whose issues, or pull requests linked to such issues, carry one of the labels.
+    """
+    issues = Issue.objects.filter(labels__name__in=label_names)
+    return GithubUser.objects.filter(
+        Q(pk__in=issues.values('user_id'))
+        | Q(pk__in=PullRequest.objects.filter(issue__in=issues).values('user_id'))
+    )
+
+
+def rescore_contributors(users: QuerySet) -> RescoreReport:
+    """
+    Recomputes the scores and daily rollups of `users` from their live points, e.g. after label
+    points changed. Both are rewritten by set-based statements restricted to `users`, which the
+    database reads as a subquery, so the time taken grows with their contributions only. The rank
+    index is rebuilt on its next read rather than moved total by total.
+    """
+    started = time.perf_counter()
+    users = users.order_by().values('pk')
+    with transaction.atomic():
+        # daily rollups add up to the scores, and are cheaper to sum than the contributions themselves
+        rebuild_rollups(users)
+        users_sql, users_params = compile_queryset(users)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                UPDATE_SCORES_SQL.format(
+                    score=connection.ops.quote_name(ContributorScore._meta.db_table),
+                    rollup=connection.ops.quote_name(ContributionRollup._meta.db_table),
+                    users=users_sql,
+                ),
+                (connection.ops.adapt_datetimefield_value(timezone.now()),) + users_params,
+            )
+            changed = cursor.rowcount
+        created = create_scores(GithubUser.objects.with_points().filter(pk__in=users, score__isnull=True))
+        rescored = users.count()
+        transaction.on_commit(rank_index.invalidate)
+    return RescoreReport(users=rescored, changed=changed + len(created), seconds=time.perf_counter() - started)
+
+
+def publish_scores():
+    """
+    Makes committed score changes visible: invalidates cached responses and rebuilds the snapshot.
+    """
+    rank_index.advance(bump_version())
+    snapshot_store.rebuild_async()
+
+
+def current_tracker() -> Optional[ScoreTracker]:
+    return getattr(_local, 'tracker', None)
+
+
+@contextmanager
+def track_scores():
+    """
+    Opens a transaction in which changed points are tracked and applied to `ContributorScore` on
+    exit. Nested calls join the outermost tracker, so every change is applied exactly once.
+    """
+    tracker = current_tracker()
+    if tracker is not None:
+        yield tracker
+        return
+
+    tracker = ScoreTracker()
+    _local.tracker = tracker
+    try:
+        with transaction.atomic():
+            yield tracker
+            tracker.apply()
+    finally:
+        _local.tracker = None
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from .mixins import DynamicFieldsSerializerMixin
 from .models import GithubUser, Repository, Label, Issue, PullRequest
 
 
@@ -40,7 +41,7 @@ class PullRequestSerializer(serializers.ModelSerializer):
         )
 
 
-class GithubUserSerializer(serializers.ModelSerializer):
+class GithubUserSerializer(DynamicFieldsSerializerMixin, serializers.ModelSerializer):
     issues = IssueSerializer(many=True)
     pull_requests = PullRequestSerializer(many=True)
     points = serializers.IntegerField()
@@ -48,3 +49,10 @@ class GithubUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = GithubUser
         fields = ('id', 'username', 'avatar_url', 'points', 'issues', 'pull_requests')
+
+
+class GithubUserDetailSerializer(GithubUserSerializer):
+    rank = serializers.IntegerField()
+
+    class Meta(GithubUserSerializer.Meta):
+        fields = GithubUserSerializer.Meta.fields + ('rank',)
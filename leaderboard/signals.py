@@ -0,0 +1,64 @@
+import logging
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .labels import label_registry
+from .models import Label
+from .scoring import labelled_contributors
+from .webhooks import queue_rescore
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Label)
+def remember_label_points(sender, instance: Label, raw: bool, **kwargs):
+    if raw:
+        return
+    instance.previous_points = Label.objects.filter(pk=instance.pk).values_list('points', flat=True).first()
+
+
+@receiver(post_save, sender=Label)
+def invalidate_label_registry(sender, instance: Label, created: bool, **kwargs):
+    # webhooks save every label they see, only points matter to the registry
+    if getattr(instance, 'previous_points', None) != instance.points and (instance.points > 0 or not created):
+        label_registry.invalidate()
+
+
+@receiver(post_delete, sender=Label)
+def forget_label(sender, instance: Label, **kwargs):
+    if instance.points > 0:
+        label_registry.invalidate()
+
+
+@receiver(post_save, sender=Label)
+def rescore_label(sender, instance: Label, created: bool, raw: bool, **kwargs):
+    """
+    Queues the rescoring of the contributors of a label whose points changed, as it changes which
+    issues count and what every pull request linked to them is worth. Labels may be carried by
+    many contributors, so the `process_webhooks` worker rescores them rather than the request.
+    """
+    if raw or created or getattr(instance, 'previous_points', instance.points) == instance.points:
+        return
+    instance.rescore_delivery = queue_rescore(labels=[instance.name])
+    logger.info(
+        f'label {instance.name} went from {instance.previous_points} to {instance.points} points, '
+        f'queued the rescoring of its contributors'
+    )
+
+
+@receiver(pre_delete, sender=Label)
+def remember_label_contributors(sender, instance: Label, **kwargs):
+    # the labels of issues are gone by the time the label itself is deleted
+    if instance.points:
+        instance.contributor_ids = list(labelled_contributors([instance.name]).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Label)
+def rescore_deleted_label(sender, instance: Label, **kwargs):
+    if not getattr(instance, 'contributor_ids', None):
+        return
+    queue_rescore(users=instance.contributor_ids)
+    logger.info(
+        f'label {instance.name} deleted, queued the rescoring of {len(instance.contributor_ids)} contributor(s)'
+    )
@@ -0,0 +1,222 @@
+import fcntl
+import gzip
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from .caching import current_version, get_version
+from .fast_serializers import render_contributors
+from .models import GithubUser
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ('identity', 'gzip', 'br')
+MAGIC = b'LBSN'
+FORMAT_VERSION = 1
+# magic, format version, scores version, then (offset, length, crc32) of every encoding
+HEADER = struct.Struct('<4sHQ' + 'QQI' * len(ENCODINGS))
+
+
+class CorruptSnapshot(Exception):
+    pass
+
+
+class Snapshot:
+    """
+    Read-only memory mapping of a snapshot file. Every process maps the same file, so the
+    leaderboard is held once in the page cache however many workers serve it.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns)
+            if stat.st_size < HEADER.size:
+                raise CorruptSnapshot(path)
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, self.version, *entries = HEADER.unpack_from(self._map)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise CorruptSnapshot(path)
+
+        view = memoryview(self._map)
+        self._variants: Dict[str, memoryview] = {}
+        for i, encoding in enumerate(ENCODINGS):
+            offset, length, checksum = entries[3 * i:3 * i + 3]
+            if not length:
+                continue
+            if offset + length > len(self._map):
+                raise CorruptSnapshot(path)
+            variant = view[offset:offset + length]
+            if zlib.crc32(variant) != checksum:
+                raise CorruptSnapshot(path)
+            self._variants[encoding] = variant
+        if 'identity' not in self._variants:
+            raise CorruptSnapshot(path)
+        self.etag = f'"{self.version}-{entries[2]:08x}"'
+
+    def encoded(self, encoding: str) -> Optional[memoryview]:
+        return self._variants.get(encoding)
+
+
+def choose_encoding(accept_encoding: str, snapshot: Snapshot) -> str:
+    """
+    Picks the smallest variant of `snapshot` the client accepts, per its `Accept-Encoding` header.
+    """
+    accepted = set()
+    for coding in accept_encoding.lower().split(','):
+        name, _, params = coding.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(name.strip())
+    for encoding in ('br', 'gzip'):
+        if (encoding in accepted or '*' in accepted) and snapshot.encoded(encoding) is not None:
+            return encoding
+    return 'identity'
+
+
+def render_snapshot() -> Dict[str, bytes]:
+    """
+    Renders the full contributor list once, along with its compressed variants.
+    """
+    content = render_contributors(GithubUser.objects.scored().with_contributions())
+    variants = {
+        'identity': content,
+        'gzip': gzip.compress(content, compresslevel=6),
+    }
+    if brotli:
+        variants['br'] = brotli.compress(content, quality=5)
+    return variants
+
+
+def read_version(path: str) -> Optional[int]:
+    """
+    Scores version of the snapshot file at `path`, `None` when there is none.
+    """
+    try:
+        with open(path, 'rb') as file:
+            header = file.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, format_version, version = HEADER.unpack(header)[:3]
+    return version if magic == MAGIC and format_version == FORMAT_VERSION else None
+
+
+def write_snapshot(path: str, version: int, variants: Dict[str, bytes]):
+    """
+    Writes a snapshot file next to `path` and moves it in place, so that readers either map the
+    previous file or the complete new one.
+    """
+    entries = []
+    offset = HEADER.size
+    for encoding in ENCODINGS:
+        content = variants.get(encoding, b'')
+        entries += [offset, len(content), zlib.crc32(content)]
+        offset += len(content)
+
+    temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temporary_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, *entries))
+            for encoding in ENCODINGS:
+                file.write(variants.get(encoding, b''))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        # e.g. a full disk, which a leftover file would only make worse
+        try:
+            os.unlink(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class SnapshotStore:
+    """
+    Serves the snapshot file shared by the processes of a host. The first of them to notice that
+    the scores version moved past the file rebuilds it in a background thread, meanwhile serving
+    the previous one, and the others switch to the new file on their next read, by noticing that
+    the path now points to another inode. Every host keeps its own file current that way.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    @property
+    def path(self) -> str:
+        return str(settings.LEADERBOARD_SNAPSHOT_PATH)
+
+    def get(self) -> Snapshot:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.rebuild()
+            stat = os.stat(self.path)
+
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.file_id != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                snapshot = Snapshot(self.path)
+            except CorruptSnapshot:
+                logger.exception('corrupt leaderboard snapshot, rebuilding it')
+                self.rebuild(force=True)
+                snapshot = Snapshot(self.path)
+            self._snapshot = snapshot
+        # the version this process read lately, so serving the snapshot does not query
+        if snapshot.version != current_version():
+            self.rebuild_async()
+        return snapshot
+
+    def rebuild(self, force: bool = False):
+        # serializes rebuilds of all processes, so an older rendering never replaces a newer one
+        with open(f'{self.path}.lock', 'wb') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                version = get_version()
+                # another process may have rebuilt it while this one waited for the lock
+                if force or read_version(self.path) != version:
+                    write_snapshot(self.path, version, render_snapshot())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return version
+
+    def rebuild_async(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name='leaderboard-snapshot', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            version = None
+            # scores may change again while building, keep going until the snapshot is current
+            while version != get_version():
+                version = self.rebuild()
+        except Exception:
+            logger.exception('failed to rebuild the leaderboard snapshot')
+        finally:
+            with self._lock:
+                self._rebuilding = False
+            connections.close_all()
+
+
+snapshot_store = SnapshotStore()
@@ -1 +1,1265 @@
-# Create your tests here.
+import gzip
+import hashlib
+import hmac
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from typing import Optional, Union
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+
+import dateutil.parser
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.http import StreamingHttpResponse
+from django.db import connection
+from django.db.models import F, Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from rest_framework.renderers import JSONRenderer
+
+from .caching import LEADERBOARD_VERSION_KEY, bump_version, current_version, forget_versions, get_version
+from .data_models import IssueData, PullRequestData, parse_timestamp
+from .fast_serializers import render_contributors
+from .github import GithubClient, GraphQLClient, GraphQLError, Throttle
+from .references import IssueReference, closing_references
+from .models import (
+    ContributionRollup, ContributorScore, DeliveryStatus, GithubUser, Label, Repository, Issue, PullRequest,
+    Version, WebhookDelivery,
+)
+from .pagination import ContributorCursorPagination
+from .ranking import RankIndex
+from .scoring import create_scores, publish_scores, rebuild_rollups, track_scores
+from .serializers import GithubUserSerializer
+from .snapshot import Snapshot, SnapshotStore, choose_encoding, write_snapshot
+from .utils import CONTRIBUTION_ACCEPTED_TOPIC, GITHUB_TOKEN, GITHUB_WEBHOOK_SECRET
+from .views import ContributorsListView
+from .webhooks import claim, process_delivery
+
+NOW = datetime(2022, 10, 1, tzinfo=timezone.utc)
+TIMESTAMP = '2022-10-01T00:00:00Z'
+
+
+def setUpModule():
+    # every test reads versions from its own database, rather than from what an earlier test left
+    # in this process
+    global version_ttl
+    version_ttl = override_settings(LEADERBOARD_VERSION_TTL=0)
+    version_ttl.enable()
+
+
+def tearDownModule():
+    version_ttl.disable()
+
+
+def create_contributors(count: int):
+    """
+    Creates `count` users, each with a labelled issue and a merged pull request closing it.
+    """
+    repository = Repository.objects.create(id=1, name='leaderboard', consider_contributions=True)
+    label = Label.objects.create(name='feature', color='ffffff', points=10)
+    users = GithubUser.objects.bulk_create([
+        GithubUser(id=i, username=f'user{i}', avatar_url=f'https://avatars/{i}') for i in range(1, count + 1)
+    ])
+    pull_requests = PullRequest.objects.bulk_create([
+        PullRequest(
+            id=user.id, url='https://api.github.com/pr', html_url='https://github.com/pr', title='pr', body='',
+            state='closed', created_at=NOW, updated_at=NOW, merged_at=NOW, merged=True, user=user,
+            repository=repository,
+        )
+        for user in users
+    ])
+    issues = Issue.objects.bulk_create([
+        Issue(
+            id=pr.id, title='issue', url=f'https://api.github.com/repos/iiitv/leaderboard/issues/{pr.id}',
+            repository=repository, state='open',
+            created_at=NOW, updated_at=NOW, user=pr.user, pr=pr,
+        )
+        for pr in pull_requests
+    ])
+    Issue.labels.through.objects.bulk_create([
+        Issue.labels.through(issue_id=issue.id, label_id=label.name) for issue in issues
+    ])
+    create_scores(GithubUser.objects.ranked())
+
+
+def isolate_snapshots(test: SimpleTestCase):
+    """
+    Points the snapshot to a temporary directory and keeps published scores from rebuilding it in a
+    background thread, which would race the test for the database.
+    """
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    path = override_settings(LEADERBOARD_SNAPSHOT_PATH=os.path.join(directory.name, 'leaderboard.snapshot'))
+    path.enable()
+    test.addCleanup(path.disable)
+    patcher = mock.patch('leaderboard.scoring.snapshot_store')
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return directory.name
+
+
+class ContributorsQueryCountTests(TestCase):
+    # users with their scores, issues, feature labels of those issues and pull requests
+    QUERIES = 4
+
+    def assert_serialized_in_fixed_queries(self, count: int):
+        create_contributors(count)
+        with self.assertNumQueries(self.QUERIES):
+            data = GithubUserSerializer(GithubUser.objects.scored().with_contributions(), many=True).data
+        self.assertEqual(len(data), count)
+        self.assertEqual(data[0]['points'], 30)
+        self.assertEqual(data[0]['issues'][0]['points'], 10)
+        self.assertEqual(data[0]['issues'][0]['labels'], [{'name': 'feature', 'color': 'ffffff', 'points': 10}])
+        self.assertEqual(data[0]['pull_requests'][0]['points'], 20)
+
+    def test_10_users(self):
+        self.assert_serialized_in_fixed_queries(10)
+
+    def test_1000_users(self):
+        self.assert_serialized_in_fixed_queries(1000)
+
+    def assert_fields_queried(self, params: dict, queries: int, tables: 'set[str]') -> dict:
+        create_contributors(3)
+        # the version is created beforehand, so reading it is a single query
+        get_version()
+        # the plain list is rendered by the fast read path, pages by the serializer
+        for pagination in ({}, {'limit': 10}):
+            with self.subTest(pagination=pagination):
+                with self.assertNumQueries(queries) as context:
+                    response = self.client.get('/contributors/', dict(params, **pagination))
+                self.assertEqual(response.status_code, 200)
+                for table in {'leaderboard_issue', 'leaderboard_pullrequest'} - tables:
+                    self.assertFalse([query for query in context.captured_queries if f'"{table}"' in query['sql']])
+        return response.json()['results'][0]
+
+    def test_summary_fields_only(self):
+        # the version and users with their scores
+        contributor = self.assert_fields_queried({'fields': 'id,points'}, 2, set())
+        self.assertEqual(contributor, {'id': 1, 'points': 30})
+
+    def test_expanded_issues_only(self):
+        # the version, users with their scores, issues and feature labels of those issues
+        contributor = self.assert_fields_queried({'expand': 'issues'}, 4, {'leaderboard_issue'})
+        self.assertEqual(set(contributor), {'id', 'username', 'avatar_url', 'points', 'issues'})
+        self.assertEqual(contributor['issues'][0]['points'], 10)
+
+    def test_unknown_fields(self):
+        unknown = ({'fields': 'id,email'}, {'expand': 'labels'}, {'expand': 'points'}, {'fields': 'id', 'expand': 'x'})
+        for params in unknown:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/contributors/', params).status_code, 400)
+
+    def test_points_of_an_issue_without_prefetch(self):
+        create_contributors(1)
+        issue = Issue.objects.get()
+        # only its labels are queried, not the version of the scoring labels
+        with self.assertNumQueries(1):
+            self.assertEqual(issue.points, 10)
+
+
+class FastSerializerTests(TestCase):
+
+    def setUp(self):
+        create_contributors(3)
+        rebuild_rollups()
+        # labels without points are left out, and users without contributions are listed too
+        Label.objects.create(name='question', color='000000', points=0)
+        Issue.labels.through.objects.create(issue_id=1, label_id='question')
+        GithubUser.objects.create(id=4, username='user4', avatar_url='https://avatars/4')
+
+    def assert_same_json(self, queryset, fields=None):
+        expected = JSONRenderer().render(GithubUserSerializer(queryset.all(), many=True, fields=fields).data)
+        self.assertEqual(render_contributors(queryset.all(), fields), expected)
+
+    def test_same_json_as_the_serializer(self):
+        querysets = [
+            GithubUser.objects.scored().with_contributions(),
+            GithubUser.objects.ranked_in(1).with_contributions(repository_id=1),
+            GithubUser.objects.ranked_between(NOW.date(), NOW.date()).with_contributions(NOW.date(), NOW.date()),
+        ]
+        for queryset in querysets:
+            for fields in (None, ('id', 'points'), ('username', 'issues')):
+                with self.subTest(query=str(queryset.query), fields=fields):
+                    self.assert_same_json(queryset, fields)
+
+    def test_labels_changed_without_invalidating_the_registry(self):
+        self.assert_same_json(GithubUser.objects.scored().with_contributions())
+        Label.objects.filter(name='feature').update(points=5)
+        Label.objects.filter(name='question').update(points=1)
+        self.assert_same_json(GithubUser.objects.scored().with_contributions())
+
+
+class RankIndexTests(TestCase):
+
+    def setUp(self):
+        # three contributors with 30 points each
+        create_contributors(3)
+        self.index = RankIndex()
+        self.index.rebuild()
+
+    def test_rank(self):
+        self.assertEqual([self.index.rank(total) for total in (40, 30, 20)], [1, 1, 4])
+
+    def test_local_writes_move_totals_in_place(self):
+        # a write of this process, taking a contributor from 30 to 50 points once committed
+        ContributorScore.objects.filter(user_id=1).update(total=50)
+        self.index.move([(30, 50)])
+        self.index.advance(bump_version())
+        ContributorScore.objects.filter(user_id=1).update(total=30)
+        # still what was moved, as the index was not read again
+        self.assertEqual([self.index.rank(50), self.index.rank(30)], [1, 2])
+
+    def test_rebuilt_once_the_version_moved_because_of_another_process(self):
+        ContributorScore.objects.filter(user_id=1).update(total=50)
+        self.assertEqual(self.index.rank(30), 1)
+        bump_version()
+        self.assertEqual([self.index.rank(50), self.index.rank(30)], [1, 2])
+
+    def test_writes_of_another_process_in_between_are_not_skipped(self):
+        # another process takes contributor 2 to 60 points, then this one contributor 1 to 50
+        ContributorScore.objects.filter(user_id=2).update(total=60)
+        bump_version()
+        ContributorScore.objects.filter(user_id=1).update(total=50)
+        self.index.move([(30, 50)])
+        self.index.advance(bump_version())
+        self.assertEqual([self.index.rank(60), self.index.rank(50), self.index.rank(30)], [1, 2, 3])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentScoreTrackingTests(TransactionTestCase):
+
+    def test_writes_tracking_the_same_pull_request(self):
+        # contributor 1 opened issue 1, worth 10 points, and merged pull request 1 closing it, worth 20
+        create_contributors(1)
+        issue_tracked, pull_request_tracked = threading.Event(), threading.Event()
+
+        def unlabel_issue():
+            # an `issues` delivery, taking the points of the issue and of the pull request closing it
+            with track_scores() as tracker:
+                tracker.track(Issue, [1])
+                tracker.track(PullRequest, [1])
+                Issue.labels.through.objects.filter(issue_id=1).delete()
+                issue_tracked.set()
+                # the pull request delivery only gets this far without waiting for this one to commit
+                pull_request_tracked.wait(timeout=1)
+
+        def edit_pull_request():
+            # a `pull_request` delivery of the same pull request, running at the same time
+            issue_tracked.wait()
+            with track_scores() as tracker:
+                tracker.track(PullRequest, [1])
+                pull_request_tracked.set()
+                PullRequest.objects.filter(id=1).update(title='edited')
+
+        errors = []
+
+        def run(function):
+            try:
+                function()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(function,)) for function in (unlabel_issue, edit_pull_request)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(ContributorScore.objects.get(user_id=1).total, 0)
+
+
+class ContributorPaginationTests(TestCase):
+
+    def setUp(self):
+        # three contributors with 30 points and three with none
+        create_contributors(3)
+        GithubUser.objects.bulk_create([
+            GithubUser(id=i, username=f'user{i}', avatar_url=f'https://avatars/{i}') for i in (4, 5, 6)
+        ])
+        ContributorScore.objects.bulk_create([ContributorScore(user_id=i) for i in (4, 5, 6)])
+        ContributorScore.objects.filter(user_id=2).update(total=40)
+
+    def test_pages_list_every_contributor_once(self):
+        contributors = self.client.get('/contributors/', {'fields': 'id,points'}).json()
+        self.assertEqual([user['id'] for user in contributors], [2, 1, 3, 4, 5, 6])
+
+        paginated = []
+        url = '/contributors/?fields=id,points&limit=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            paginated += page['results']
+            url = page['next']
+        self.assertEqual(paginated, contributors)
+
+    @skipUnless(connection.vendor == 'sqlite', 'the query plan format is specific to SQLite')
+    def test_pages_walk_the_score_index(self):
+        pagination = ContributorCursorPagination()
+        queryset = GithubUser.objects.scored()
+        points_field, id_field = pagination.get_ordering(queryset)
+        page = queryset.filter(
+            Q(**{f'{points_field}__lt': 30}) | Q(**{points_field: 30, f'{id_field}__gt': 1})
+        )[:3]
+        plan = page.explain()
+        self.assertIn('leaderboard_score_total_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ContributorDetailTests(TestCase):
+
+    def setUp(self):
+        # user 2 ahead with 40 points, users 1 and 3 tied with 30, and user 4 without any
+        create_contributors(3)
+        ContributorScore.objects.filter(user_id=2).update(total=40)
+        GithubUser.objects.create(id=4, username='user4', avatar_url='https://avatars/4')
+        ContributorScore.objects.create(user_id=4)
+
+    def test_rank_with_ties(self):
+        ranks = {id: self.client.get(f'/contributors/{id}/').json()['rank'] for id in (1, 2, 3, 4)}
+        self.assertEqual(ranks, {1: 2, 2: 1, 3: 2, 4: 4})
+
+    def test_by_username(self):
+        response = self.client.get('/contributors/by-username/user3/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.client.get('/contributors/3/').json())
+        self.assertEqual((response.json()['username'], response.json()['points']), ('user3', 30))
+
+    def test_unknown_contributor(self):
+        for url in ('/contributors/5/', '/contributors/by-username/user5/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RepositoryViewTests(TestCase):
+
+    def setUp(self):
+        # users 1 to 3 with 30 points in `leaderboard`, and users 1 and 2 with 30 and 10 in `another`
+        create_contributors(3)
+        another = Repository.objects.create(id=2, name='another', consider_contributions=True)
+        Repository.objects.create(id=3, name='ignored', consider_contributions=False)
+        pull_request = PullRequest.objects.create(
+            id=10, url='https://api.github.com/pr', html_url='https://github.com/pr', title='pr', body='',
+            state='closed', created_at=NOW, updated_at=NOW, merged_at=NOW, merged=True, user_id=1,
+            repository=another,
+        )
+        for id, user, pr in ((10, 1, pull_request), (11, 2, None)):
+            issue = Issue.objects.create(
+                id=id, title='issue', url=f'https://api.github.com/repos/iiitv/another/issues/{id}',
+                repository=another, state='open', created_at=NOW, updated_at=NOW, user_id=user, pr=pr,
+            )
+            issue.labels.add('feature')
+
+    def points(self, url: str) -> 'list[tuple[int, int]]':
+        return [(user['id'], user['points']) for user in self.client.get(url).json()]
+
+    def test_participating_repositories(self):
+        self.assertEqual(self.client.get('/repositories/').json(), [
+            {'id': 2, 'name': 'another'},
+            {'id': 1, 'name': 'leaderboard'},
+        ])
+
+    def test_points_of_the_repository_only(self):
+        self.assertEqual(self.points('/repositories/1/contributors/'), [(1, 30), (2, 30), (3, 30)])
+        self.assertEqual(self.points('/repositories/2/contributors/'), [(1, 30), (2, 10)])
+        contributor = self.client.get('/repositories/2/contributors/').json()[0]
+        self.assertEqual([issue['id'] for issue in contributor['issues']], [10])
+        self.assertEqual([pull_request['id'] for pull_request in contributor['pull_requests']], [10])
+
+    def test_repositories_not_participating(self):
+        for id in (3, 4):
+            with self.subTest(id=id):
+                self.assertEqual(self.client.get(f'/repositories/{id}/contributors/').status_code, 404)
+
+    def test_pages(self):
+        first = self.client.get('/repositories/1/contributors/', {'limit': 2}).json()
+        self.assertEqual([user['id'] for user in first['results']], [1, 2])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(([user['id'] for user in second['results']], second['next']), ([3], None))
+
+
+class StreamingTests(TestCase):
+
+    def setUp(self):
+        create_contributors(5)
+        rebuild_rollups()
+        # several chunks, the last of them partial
+        patcher = mock.patch.object(ContributorsListView, 'stream_chunk_size', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_json_as_the_plain_list(self):
+        for params in ({}, {'fields': 'id,points'}, {'from': '2022-10-01', 'to': '2022-10-01'}):
+            with self.subTest(params=params):
+                response = self.client.get('/contributors/', dict(params, stream='true'))
+                self.assertIsInstance(response, StreamingHttpResponse)
+                streamed = json.loads(b''.join(response.streaming_content))
+                self.assertEqual(len(streamed), 5)
+                self.assertEqual(streamed, self.client.get('/contributors/', params).json())
+
+    def test_not_paginated(self):
+        for params in ({'limit': 2}, {'cursor': 'MzA6MQ=='}):
+            with self.subTest(params=params):
+                response = self.client.get('/contributors/', dict(params, stream='true'))
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(LEADERBOARD_VERSION_TTL=60)
+class VersionedCacheTests(TestCase):
+
+    def setUp(self):
+        create_contributors(2)
+        isolate_snapshots(self)
+        forget_versions()
+        self.addCleanup(forget_versions)
+
+    def test_not_modified_until_scores_change(self):
+        response = self.client.get('/contributors/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # the scores version was read by the first request
+        with self.assertNumQueries(0):
+            response = self.client.get('/contributors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/contributors/')
+        self.assertEqual((cached.status_code, cached['ETag']), (200, etag))
+
+        ContributorScore.objects.filter(user_id=2).update(total=50)
+        publish_scores()
+        response = self.client.get('/contributors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([(user['id'], user['points']) for user in response.json()], [(2, 50), (1, 30)])
+
+    def test_etag_depends_on_the_request(self):
+        etag = self.client.get('/contributors/')['ETag']
+        response = self.client.get('/contributors/', {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_versions_bumped_by_other_processes_are_read_once_expired(self):
+        version = current_version()
+        Version.objects.filter(key=LEADERBOARD_VERSION_KEY).update(value=F('value') + 1)
+        self.assertEqual(current_version(), version)
+        with mock.patch('leaderboard.caching.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertEqual(current_version(), version + 1)
+
+
+class SnapshotTests(TestCase):
+
+    def setUp(self):
+        self.directory = isolate_snapshots(self)
+        self.path = os.path.join(self.directory, 'leaderboard.snapshot')
+
+    def test_written_then_mapped(self):
+        write_snapshot(self.path, 7, {'identity': b'[]', 'gzip': gzip.compress(b'[]')})
+        snapshot = Snapshot(self.path)
+        self.assertEqual(snapshot.version, 7)
+        self.assertEqual(bytes(snapshot.encoded('identity')), b'[]')
+        self.assertEqual(choose_encoding('br, gzip', snapshot), 'gzip')
+        self.assertEqual(choose_encoding('gzip;q=0', snapshot), 'identity')
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        with mock.patch('os.fsync', side_effect=OSError('No space left on device')):
+            with self.assertRaises(OSError):
+                write_snapshot(self.path, 7, {'identity': b'[]'})
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_rebuilt_once_the_scores_version_moved(self):
+        create_contributors(2)
+        store = SnapshotStore()
+        snapshot = store.get()
+        self.assertEqual(snapshot.version, get_version())
+        self.assertEqual([user['id'] for user in json.loads(bytes(snapshot.encoded('identity')))], [1, 2])
+
+        with mock.patch.object(store, 'rebuild_async') as rebuild_async:
+            self.assertIs(store.get(), snapshot)
+            rebuild_async.assert_not_called()
+            bump_version()
+            # served meanwhile
+            self.assertIs(store.get(), snapshot)
+            rebuild_async.assert_called_once()
+
+    @override_settings(LEADERBOARD_VERSION_TTL=60)
+    def test_served_without_querying(self):
+        create_contributors(2)
+        forget_versions()
+        self.addCleanup(forget_versions)
+        store = SnapshotStore()
+        snapshot = store.get()
+        with self.assertNumQueries(0):
+            self.assertIs(store.get(), snapshot)
+
+
+class ParseTimestampTests(SimpleTestCase):
+
+    def test_same_as_dateutil(self):
+        for value in (
+                TIMESTAMP, '2022-12-31T23:59:59Z', '2022-10-01T00:00:00+05:30', '2022-10-01T00:00:00.123Z',
+                '2022-10-01 00:00:00Z', '2022-10-01',
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(parse_timestamp(value), dateutil.parser.parse(value))
+        with self.assertRaises(ValueError):
+            parse_timestamp('2022-02-30T00:00:00Z')
+
+    def test_data_models_read_the_same_timestamps(self):
+        payload = dict(issue_payload(1, 1), updated_at='2022-10-02T08:30:00+02:00', closed_at='2022-10-03T00:00:00Z')
+        issue = IssueData(**payload, parent_data={'repository': repository_payload()})
+        with mock.patch('leaderboard.data_models.parse_timestamp', dateutil.parser.parse):
+            expected = IssueData(**payload, parent_data={'repository': repository_payload()})
+        for field in ('created_at', 'updated_at', 'closed_at'):
+            self.assertEqual(getattr(issue, field), getattr(expected, field))
+
+
+def user_payload(id: int) -> dict:
+    return {'login': f'user{id}', 'id': id, 'avatar_url': f'https://avatars/{id}'}
+
+
+def repository_payload() -> dict:
+    return {
+        'id': 1, 'name': 'leaderboard', 'full_name': 'iiitv/leaderboard', 'private': False,
+        'topics': [CONTRIBUTION_ACCEPTED_TOPIC],
+    }
+
+
+def issue_payload(id: int, user: int) -> dict:
+    return {
+        'id': id, 'number': id, 'title': 'issue', 'url': f'https://api.github.com/repos/iiitv/leaderboard/issues/{id}',
+        'repository_url': 'https://api.github.com/repos/iiitv/leaderboard',
+        'html_url': f'https://github.com/iiitv/leaderboard/issues/{id}', 'user': user_payload(user),
+        'labels': [{'id': 1, 'url': 'https://api.github.com/labels/feature', 'name': 'feature', 'color': 'ffffff'}],
+        'state': 'open', 'locked': False, 'assignee': None, 'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+        'closed_at': None,
+    }
+
+
+def issue_node(id: int, user: int) -> dict:
+    return {
+        'databaseId': id, 'number': id, 'title': 'issue', 'url': f'https://github.com/iiitv/leaderboard/issues/{id}',
+        'state': 'OPEN', 'locked': False, 'createdAt': TIMESTAMP, 'updatedAt': TIMESTAMP, 'closedAt': None,
+        'author': {'login': f'user{user}', 'avatarUrl': f'https://avatars/{user}', 'databaseId': user},
+        'assignees': {'nodes': [{'login': 'user1', 'avatarUrl': 'https://avatars/1', 'databaseId': 1}]},
+        'labels': {'nodes': [
+            {'id': 'LA_feature', 'name': 'feature', 'color': 'ffffff', 'url': 'https://github.com/labels/feature'},
+        ]},
+        'repository': {
+            'databaseId': 1, 'name': 'leaderboard', 'nameWithOwner': 'iiitv/leaderboard', 'isPrivate': False,
+            'repositoryTopics': {'nodes': [{'topic': {'name': CONTRIBUTION_ACCEPTED_TOPIC}}]},
+        },
+    }
+
+
+def pull_request_payload(id: int, user: int, body: Optional[str] = '') -> dict:
+    return {
+        'id': id, 'node_id': f'PR_{id}', 'url': f'https://api.github.com/repos/iiitv/leaderboard/pulls/{id}',
+        'html_url': f'https://github.com/iiitv/leaderboard/pull/{id}', 'state': 'closed', 'locked': False,
+        'title': 'pull request', 'user': user_payload(user), 'body': body, 'created_at': TIMESTAMP,
+        'updated_at': TIMESTAMP, 'closed_at': TIMESTAMP, 'merged_at': TIMESTAMP, 'merged': True,
+    }
+
+
+class FakeGithubServer:
+    """
+    GitHub's API served on localhost. The REST API serves `resources` by path, paginating lists and
+    answering 304 when given the ETag of an unchanged response, and the GraphQL API answers
+    `closingIssuesReferences` queries from the issue nodes `links` holds by pull request node id.
+    """
+
+    def __init__(
+            self,
+            links: 'dict[str, list[dict]]',
+            resources: 'dict[str, Union[dict, list]]' = None,
+            token: str = GITHUB_TOKEN,
+    ):
+        self.links = links
+        self.resources = resources or {}
+        self.queries: 'list[dict]' = []
+        self.requests: 'list[str]' = []
+        self.statuses: 'list[int]' = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                url = urlparse(self.path)
+                resource = server.resources.get(url.path)
+                if resource is None:
+                    return self.reply(404, {'message': 'Not Found'})
+                headers = {}
+                if isinstance(resource, list):
+                    query = parse_qs(url.query)
+                    page, per_page = int(query.get('page', ['1'])[0]), int(query.get('per_page', ['30'])[0])
+                    last = max(math.ceil(len(resource) / per_page), 1)
+                    if last > 1:
+                        headers['Link'] = f'<{server.api_url}{url.path}?per_page={per_page}&page={last}>; rel="last"'
+                    resource = resource[(page - 1) * per_page:page * per_page]
+                headers['ETag'] = f'"{hashlib.sha1(json.dumps(resource).encode()).hexdigest()}"'
+                if self.headers['If-None-Match'] == headers['ETag']:
+                    return self.reply(304, None, headers)
+                self.reply(200, resource, headers)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                server.queries.append(body)
+                if self.headers['Authorization'] != f'token {token}':
+                    return self.reply(401, {'message': 'Bad credentials'})
+                self.reply(200, server.answer(body['query'], body['variables']))
+
+            def reply(self, status: int, data: 'Union[dict, list, None]', headers: 'dict[str, str]' = None):
+                server.statuses.append(status)
+                content = json.dumps(data).encode() if data is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.api_url = f'http://127.0.0.1:{self.httpd.server_port}'
+        self.url = f'{self.api_url}/graphql'
+
+    def answer(self, query: str, variables: dict) -> dict:
+        if 'closingIssuesReferences' not in query:
+            return {'data': None, 'errors': [{'message': 'Field is not supported'}]}
+        nodes, errors = [], []
+        for id in variables['ids']:
+            if id in self.links:
+                nodes.append({'id': id, 'closingIssuesReferences': {'nodes': self.links[id]}})
+            else:
+                nodes.append(None)
+                errors.append({'type': 'NOT_FOUND', 'message': f"Could not resolve to a node with the id '{id}'"})
+        return {'data': {'nodes': nodes}, 'errors': errors} if errors else {'data': {'nodes': nodes}}
+
+    def __enter__(self) -> 'FakeGithubServer':
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeClock:
+    """
+    Monotonic and wall clocks of a `Throttle`, moved forward by its sleeps only.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps: 'list[float]' = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+    def throttle(self) -> Throttle:
+        return Throttle(clock=self, sleep=self.sleep, wall_clock=lambda: 1_600_000_000 + self.now)
+
+    def rate_limit(self, remaining: int, reset_in: int, limit: int = 5000) -> 'dict[str, str]':
+        return {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(int(1_600_000_000 + self.now + reset_in)),
+        }
+
+
+class ThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.throttle = self.clock.throttle()
+
+    def acquire(self, times: int) -> 'list[float]':
+        for _ in range(times):
+            self.throttle.acquire()
+        return self.clock.sleeps
+
+    def test_not_throttled_while_plenty_is_left(self):
+        self.throttle.update(self.clock.rate_limit(remaining=4000, reset_in=3600))
+        self.assertEqual(self.acquire(100), [])
+
+    def test_remaining_requests_spread_until_the_reset(self):
+        # 100 requests left for 200 seconds, one every other second after the first
+        self.throttle.update(self.clock.rate_limit(remaining=100, reset_in=200))
+        self.assertEqual(self.acquire(4), [2.0, 2.0, 2.0])
+        # back to full speed once the limit reset
+        self.throttle.update(self.clock.rate_limit(remaining=5000, reset_in=3600))
+        self.assertEqual(self.acquire(10), [2.0, 2.0, 2.0])
+
+    def test_waits_for_the_reset_once_nothing_is_left(self):
+        self.throttle.update(self.clock.rate_limit(remaining=0, reset_in=60))
+        self.assertEqual(self.acquire(1), [60.0])
+
+    def test_retry_after(self):
+        self.throttle.update({'Retry-After': '30'})
+        self.assertEqual(self.acquire(2), [30.0])
+
+
+class GithubClientTests(TestCase):
+
+    def test_unchanged_resources_come_back_as_304s(self):
+        resources = {'/repos/iiitv/leaderboard': repository_payload()}
+        with FakeGithubServer({}, resources) as server:
+            url = f'{server.api_url}/repos/iiitv/leaderboard'
+            self.assertEqual(GithubClient().get_json(url), repository_payload())
+            # another client, as another process would, shares the ETags
+            self.assertEqual(GithubClient().get_json(url), repository_payload())
+            resources['/repos/iiitv/leaderboard'] = dict(repository_payload(), name='leaderboard-v2')
+            self.assertEqual(GithubClient().get_json(url)['name'], 'leaderboard-v2')
+            self.assertEqual(GithubClient().get_json(url)['name'], 'leaderboard-v2')
+        self.assertEqual(server.statuses, [200, 304, 200, 304])
+
+    def test_links_of_a_page_served_from_the_cache(self):
+        resources = {'/repos/iiitv/leaderboard/issues': [issue_payload(id, 1) for id in range(1, 4)]}
+        with FakeGithubServer({}, resources) as server:
+            url = f'{server.api_url}/repos/iiitv/leaderboard/issues'
+            first = GithubClient().get_page(url, {'per_page': 2})
+            self.assertEqual(GithubClient().get_page(url, {'per_page': 2}), first)
+        self.assertEqual(server.statuses, [200, 304])
+        self.assertEqual(first[1]['last'], f'{server.api_url}/repos/iiitv/leaderboard/issues?per_page=2&page=2')
+
+
+class GraphQLClientTests(SimpleTestCase):
+
+    def test_closing_issues_of_many_pull_requests_in_one_request(self):
+        links = {'PR_1': [issue_node(1, 1), issue_node(2, 2)], 'PR_2': [issue_node(3, 1)], 'PR_3': []}
+        with FakeGithubServer(links) as server:
+            closing_issues = GraphQLClient(url=server.url).closing_issues(['PR_1', 'PR_2', 'PR_3', 'PR_4'])
+
+        self.assertEqual(len(server.queries), 1)
+        self.assertEqual(server.queries[0]['variables'], {'ids': ['PR_1', 'PR_2', 'PR_3', 'PR_4']})
+        self.assertEqual(
+            {id: [data['issue']['id'] for data in issues] for id, issues in closing_issues.items()},
+            {'PR_1': [1, 2], 'PR_2': [3], 'PR_3': [], 'PR_4': []},
+        )
+        issue = IssueData.from_dict(closing_issues['PR_1'][1])
+        self.assertEqual(issue.url, 'https://api.github.com/repos/iiitv/leaderboard/issues/2')
+        self.assertEqual((issue.user.id, issue.assignee.id, issue.state), (2, 1, 'open'))
+        self.assertEqual([label.name for label in issue.labels], ['feature'])
+        self.assertEqual((issue.repository.id, issue.repository.topics), (1, [CONTRIBUTION_ACCEPTED_TOPIC]))
+        self.assertEqual(issue.created_at, NOW)
+
+    def test_deleted_author_is_the_ghost_user(self):
+        node = issue_node(1, 1)
+        node['author'] = None
+        with FakeGithubServer({'PR_1': [node]}) as server:
+            closing_issues = GraphQLClient(url=server.url).closing_issues(['PR_1'])
+        self.assertEqual(closing_issues['PR_1'][0]['issue']['user']['login'], 'ghost')
+
+    def test_errors(self):
+        with FakeGithubServer({}) as server:
+            with self.assertRaises(GraphQLError):
+                GraphQLClient(url=server.url).execute('query { viewer { login } }')
+            with self.assertRaises(requests.HTTPError):
+                GraphQLClient(GithubClient(token='revoked').post, server.url).closing_issues(['PR_1'])
+
+
+class PullRequestIngestQueryCountTests(TestCase):
+    # savepoints, the pull request with its user, repository and score, the linked issues read at
+    # once, the two missing ones written with their users and labels in one batch, the links, and
+    # the points deltas applied to scores and rollups
+    QUERIES = 34
+
+    def test_pull_request_linking_five_issues(self):
+        create_contributors(3)
+        # the first three issues are known already, the other two only to GitHub, all opened
+        # by the author of the pull request or by users the ingest already resolved
+        links = {'PR_10': [issue_node(1, 1), issue_node(2, 2), issue_node(3, 3), issue_node(4, 2), issue_node(5, 4)]}
+        pull_request = PullRequestData(**pull_request_payload(10, 4), parent_data={'repository': repository_payload()})
+
+        with FakeGithubServer(links) as server:
+            with mock.patch('leaderboard.data_models.graphql_client', GraphQLClient(url=server.url)):
+                with self.assertNumQueries(self.QUERIES):
+                    pull_request.to_model()
+
+        self.assertEqual(sorted(PullRequest.objects.get(id=10).issue_set.values_list('id', flat=True)), [1, 2, 3, 4, 5])
+        # the pull request is worth its five issues and its merge points, its author opened issue 5
+        self.assertEqual(ContributorScore.objects.get(user_id=4).total, 5 * 10 + 10 + 10)
+        # pull request 1 lost its only issue
+        self.assertEqual(ContributorScore.objects.get(user_id=1).total, 10)
+        self.assertEqual(
+            dict(ContributorScore.objects.values_list('user_id', 'total')),
+            dict(GithubUser.objects.with_points().values_list('id', 'computed_points')),
+        )
+
+
+class ScoreDeltaTests(TestCase):
+    """
+    Scores and daily rollups are only ever moved by the difference a write makes, and must always
+    add up to the points recomputed from scratch.
+    """
+
+    def setUp(self):
+        Label.objects.create(name='feature', color='ffffff', points=10)
+        Label.objects.create(name='bug', color='ff0000', points=0)
+        # GitHub links no issue to any pull request besides the ones of their descriptions
+        client = GraphQLClient(transport=lambda url, body, headers: json.dumps({'data': {'nodes': []}}).encode())
+        patcher = mock.patch('leaderboard.data_models.graphql_client', client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def issue(self, id: int, user: int, labels=('feature',), **fields) -> Issue:
+        payload = dict(issue_payload(id, user), **fields)
+        payload['labels'] = [{'name': name, 'color': 'ffffff'} for name in labels]
+        issue = IssueData(**payload, parent_data={'repository': repository_payload()}).to_model()
+        self.assert_scores_recomputed()
+        return issue
+
+    def pull_request(self, id: int, user: int, body: str, **fields) -> PullRequest:
+        payload = dict(pull_request_payload(id, user, body), **fields)
+        pull_request = PullRequestData(**payload, parent_data={'repository': repository_payload()}).to_model()
+        self.assert_scores_recomputed()
+        return pull_request
+
+    def assert_scores_recomputed(self):
+        live = GithubUser.objects.with_points()
+        self.assertEqual(
+            {score.user_id: (score.issue_points, score.pull_request_points, score.total)
+             for score in ContributorScore.objects.all()},
+            {user.id: (user.issue_points, user.pull_request_points, user.computed_points) for user in live},
+        )
+        rollups = {}
+        for user_id, issue_points, pull_request_points in ContributionRollup.objects.values_list(
+                'user_id', 'issue_points', 'pull_request_points',
+        ):
+            rollups[user_id] = rollups.get(user_id, 0) + issue_points + pull_request_points
+        self.assertEqual(
+            {user_id: points for user_id, points in rollups.items() if points},
+            {user.id: user.computed_points for user in live if user.computed_points},
+        )
+        index = RankIndex()
+        self.assertEqual(
+            {user.id: index.rank(user.score.total) for user in GithubUser.objects.select_related('score')},
+            {user.id: user.rank for user in GithubUser.objects.ranked()},
+        )
+
+    def points(self) -> 'dict[int, int]':
+        return dict(ContributorScore.objects.values_list('user_id', 'total'))
+
+    def test_issue_events(self):
+        self.issue(1, 1)
+        self.issue(2, 1, labels=('bug',))
+        self.assertEqual(self.points(), {1: 10})
+        # labelled, unlabelled, then closed
+        self.issue(2, 1, labels=('bug', 'feature'))
+        self.assertEqual(self.points(), {1: 20})
+        self.issue(1, 1, labels=())
+        self.assertEqual(self.points(), {1: 10})
+        self.issue(2, 1, labels=('bug', 'feature'), state='closed', closed_at=TIMESTAMP)
+        self.assertEqual(self.points(), {1: 10})
+
+    def test_pull_request_events(self):
+        self.issue(1, 1)
+        self.issue(2, 1)
+        self.pull_request(10, 2, 'Fixes #1')
+        self.assertEqual(self.points(), {1: 20, 2: 20})
+        # a second issue closed by the same pull request only adds its label points
+        self.pull_request(10, 2, 'Fixes #1, fixes #2')
+        self.assertEqual(self.points(), {1: 20, 2: 30})
+        # relabelling an issue moves the points of the pull request closing it
+        self.issue(2, 1, labels=())
+        self.assertEqual(self.points(), {1: 10, 2: 20})
+        self.issue(2, 1)
+        # another pull request takes issue 2 away from the first one
+        self.pull_request(11, 3, 'Closes #2')
+        self.assertEqual(self.points(), {1: 20, 2: 20, 3: 20})
+        # unlinked by editing its description
+        self.pull_request(11, 3, 'Nothing to close')
+        self.assertEqual(self.points(), {1: 20, 2: 20, 3: 0})
+        # closed without being merged
+        self.pull_request(12, 3, 'Fixes #2', merged=False, merged_at=None)
+        self.assertEqual(self.points(), {1: 20, 2: 20, 3: 0})
+        # merged later on
+        self.pull_request(12, 3, 'Fixes #2')
+        self.assertEqual(self.points(), {1: 20, 2: 20, 3: 20})
+
+    def test_drift_is_reported_then_repaired(self):
+        self.issue(1, 1)
+        self.issue(2, 2)
+        ContributorScore.objects.filter(user_id=2).update(total=50)
+        stdout = StringIO()
+        call_command('rebuild_scores', check=True, stdout=stdout)
+        self.assertIn('user2 (2): stored 50, live 10', stdout.getvalue())
+        self.assertIn('1 contributor(s) drifted', stdout.getvalue())
+
+        call_command('rebuild_scores', stdout=StringIO())
+        self.assertEqual(self.points(), {1: 10, 2: 10})
+
+    def process_queued(self):
+        with mock.patch('leaderboard.webhooks.close_old_connections'):
+            for delivery in WebhookDelivery.objects.ready():
+                self.assertTrue(claim(delivery))
+                self.assertEqual(process_delivery(delivery.pk), DeliveryStatus.DONE)
+
+    def test_label_points_changes(self):
+        isolate_snapshots(self)
+        self.issue(1, 1)
+        self.issue(2, 1, labels=('bug',))
+        self.issue(3, 3)
+        self.pull_request(10, 2, 'Fixes #1, fixes #2')
+        self.assertEqual(self.points(), {1: 10, 2: 20, 3: 10})
+
+        # the rescoring is left to the worker
+        feature = Label.objects.get(name='feature')
+        feature.points = 5
+        feature.save()
+        self.assertEqual(self.points(), {1: 10, 2: 20, 3: 10})
+        self.process_queued()
+        self.assert_scores_recomputed()
+        self.assertEqual(self.points(), {1: 10, 2: 15, 3: 10})
+
+        bug = Label.objects.get(name='bug')
+        bug.points = 3
+        bug.save()
+        self.process_queued()
+        self.assert_scores_recomputed()
+        self.assertEqual(self.points(), {1: 20, 2: 18, 3: 10})
+
+        # contributors left without any point
+        feature.delete()
+        self.process_queued()
+        self.assert_scores_recomputed()
+        self.assertEqual(self.points(), {1: 10, 2: 13, 3: 0})
+        self.assertFalse(ContributionRollup.objects.filter(user_id=3).exists())
+
+
+class WindowTests(TestCase):
+
+    def setUp(self):
+        Label.objects.create(name='feature', color='ffffff', points=10)
+        isolate_snapshots(self)
+
+    @staticmethod
+    def issue(id: int, user: int, day: int, labels=('feature',)):
+        timestamp = f'2022-10-{day:02}T12:00:00Z'
+        payload = dict(issue_payload(id, user), created_at=timestamp, updated_at=timestamp)
+        payload['labels'] = [{'name': name, 'color': 'ffffff'} for name in labels]
+        IssueData(**payload, parent_data={'repository': repository_payload()}).to_model()
+
+    def contributors(self, start: str, end: str) -> 'list[tuple[int, int]]':
+        response = self.client.get('/contributors/', {'from': start, 'to': end, 'fields': 'id,points'})
+        return [(user['id'], user['points']) for user in response.json()]
+
+    def test_points_earned_in_the_window(self):
+        self.issue(1, 1, day=1)
+        self.issue(2, 1, day=3)
+        self.issue(3, 2, day=3)
+        # earned then lost again on the first day, leaving a rollup of zero points
+        self.issue(4, 3, day=1)
+        self.issue(4, 3, day=1, labels=())
+        self.issue(5, 3, day=9)
+
+        self.assertEqual(self.contributors('2022-10-01', '2022-10-01'), [(1, 10)])
+        self.assertEqual(self.contributors('2022-10-01', '2022-10-07'), [(1, 20), (2, 10)])
+        self.assertEqual(self.contributors('2022-10-02', '2022-10-09'), [(1, 10), (2, 10), (3, 10)])
+        self.assertEqual(self.contributors('2022-10-04', '2022-10-08'), [])
+
+    def test_rollups_match_a_rebuild(self):
+        self.issue(1, 1, day=1)
+        self.issue(2, 1, day=3)
+        self.issue(2, 1, day=4)
+        self.issue(3, 2, day=3, labels=())
+
+        def rollups():
+            return {
+                (user_id, day): points
+                for user_id, day, points in ContributionRollup.objects.values_list(
+                    'user_id', 'day', 'issue_points',
+                )
+                if points
+            }
+
+        maintained = rollups()
+        self.assertEqual(maintained, {(1, date(2022, 10, 1)): 10, (1, date(2022, 10, 4)): 10})
+        rebuild_rollups()
+        self.assertEqual(rollups(), maintained)
+
+
+PULL_REQUEST_URL = 'https://api.github.com/repos/iiitv/leaderboard/pulls/10'
+
+# descriptions of pull requests as contributors write them, with the issues GitHub links
+CLOSING_REFERENCES_CORPUS = [
+    ('Fixes #12', [('iiitv', 'leaderboard', 12)]),
+    ('closes iiitv/algos#34', [('iiitv', 'algos', 34)]),
+    ('Resolves: https://github.com/iiitv/algos/issues/56', [('iiitv', 'algos', 56)]),
+    (
+        'FIXED #1, fixes #2 and resolved #3.',
+        [('iiitv', 'leaderboard', 1), ('iiitv', 'leaderboard', 2), ('iiitv', 'leaderboard', 3)],
+    ),
+    # a keyword applies to one reference only
+    ('Fixes #4, #5', [('iiitv', 'leaderboard', 4)]),
+    ('Fixes #7\r\n\r\nAlso fixes #7 for real this time', [('iiitv', 'leaderboard', 7)]),
+    (
+        '## Description\r\nAdded bubble sort in Go.\r\n\r\n'
+        '<!-- Mention the issue it closes, e.g. Fixes #123 -->\r\nFixes #58\r\n\r\n'
+        '## Checklist\r\n- [x] Tests pass',
+        [('iiitv', 'leaderboard', 58)],
+    ),
+    ('Run `git commit -m "fixes #9"` to close it\n```\nfixes #10\n```\ncloses #11', [('iiitv', 'leaderboard', 11)]),
+    ('Related to #13, see https://github.com/iiitv/leaderboard/issues/14', []),
+    ('This prefixes #15 and suffixes #16', []),
+    ('Fixes https://github.com/iiitv/leaderboard/pull/17', []),
+    ('fix #18abc, fix ##19', []),
+    ('Closes #20.\nCloses iiitv/Leader-board.v2#21', [('iiitv', 'leaderboard', 20), ('iiitv', 'Leader-board.v2', 21)]),
+    ('', []),
+]
+
+
+class ClosingReferencesTests(SimpleTestCase):
+
+    def test_corpus(self):
+        for body, expected in CLOSING_REFERENCES_CORPUS:
+            with self.subTest(body=body):
+                self.assertEqual(
+                    closing_references(body, PULL_REQUEST_URL),
+                    [IssueReference(*reference) for reference in expected],
+                )
+
+    def test_url_of_the_issue_in_the_rest_api(self):
+        self.assertEqual(
+            IssueReference('iiitv', 'algos', 34).url,
+            'https://api.github.com/repos/iiitv/algos/issues/34',
+        )
+
+
+class LinkedIssuesTests(TestCase):
+
+    def setUp(self):
+        create_contributors(3)
+
+    def link(self, body: str, links: 'dict[str, list[dict]]') -> FakeGithubServer:
+        pull_request = PullRequestData(
+            **pull_request_payload(10, 4, body),
+            parent_data={'repository': repository_payload()},
+        )
+        with FakeGithubServer(links) as server:
+            with mock.patch('leaderboard.data_models.graphql_client', GraphQLClient(url=server.url)):
+                pull_request.to_model()
+        return server
+
+    def test_issues_known_locally_are_linked_without_asking_github(self):
+        server = self.link(
+            'Fixes #1, closes iiitv/leaderboard#2 and resolves https://github.com/iiitv/leaderboard/issues/3', {},
+        )
+        self.assertEqual(server.queries, [])
+        self.assertEqual(sorted(PullRequest.objects.get(id=10).issue_set.values_list('id', flat=True)), [1, 2, 3])
+
+    def test_unknown_issues_are_looked_up(self):
+        server = self.link('Fixes #1, fixes #4', {'PR_10': [issue_node(4, 2), issue_node(5, 3)]})
+        self.assertEqual(len(server.queries), 1)
+        self.assertEqual(sorted(PullRequest.objects.get(id=10).issue_set.values_list('id', flat=True)), [1, 4, 5])
+
+
+def issue_event(id: int, **fields) -> bytes:
+    issue = dict(issue_payload(id, 1), **fields)
+    return json.dumps({'action': 'opened', 'issue': issue, 'repository': repository_payload()}).encode()
+
+
+def signature(body: bytes, digest=hashlib.sha256) -> str:
+    return hmac.new(GITHUB_WEBHOOK_SECRET.encode(), body, digest).hexdigest()
+
+
+class GithubWebhookListenerTests(TestCase):
+
+    def deliver(self, body: bytes, delivery_id: str = 'delivery-1', **headers):
+        headers.setdefault('HTTP_X_HUB_SIGNATURE_256', f'sha256={signature(body)}')
+        return self.client.post(
+            '/webhook/github/', body, content_type='application/json',
+            HTTP_X_GITHUB_EVENT='issues', HTTP_X_GITHUB_DELIVERY=delivery_id, **headers,
+        )
+
+    def test_redelivery_is_not_queued_again(self):
+        body = issue_event(1)
+        self.assertEqual(self.deliver(body).status_code, 202)
+        self.assertEqual(self.deliver(body).status_code, 200)
+        self.assertEqual(
+            list(WebhookDelivery.objects.values_list('delivery_id', 'entity')), [('delivery-1', 'issue:1')],
+        )
+
+    def test_failed_delivery_is_queued_again_when_redelivered(self):
+        body = issue_event(1)
+        self.assertEqual(self.deliver(body).status_code, 202)
+        WebhookDelivery.objects.update(
+            status=DeliveryStatus.FAILED, attempts=5, retry_at=NOW, error='Traceback', processed_at=NOW,
+        )
+        self.assertEqual(self.deliver(body).status_code, 202)
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.retry_at), (DeliveryStatus.QUEUED, 0, None))
+        self.assertEqual(list(WebhookDelivery.objects.ready()), [delivery])
+
+    def test_delivery_id_reused_for_another_payload(self):
+        self.assertEqual(self.deliver(issue_event(1)).status_code, 202)
+        with self.assertLogs('leaderboard.views', 'WARNING'):
+            self.assertEqual(self.deliver(issue_event(1, title='another issue')).status_code, 409)
+        self.assertEqual(WebhookDelivery.objects.get().payload['issue']['title'], 'issue')
+
+    def test_other_deliveries_are_queued(self):
+        body = issue_event(1)
+        self.assertEqual(self.deliver(body).status_code, 202)
+        self.assertEqual(self.deliver(body, delivery_id='delivery-2').status_code, 202)
+        self.assertEqual(WebhookDelivery.objects.unfinished().count(), 2)
+
+    def test_sha256_signature(self):
+        self.assertEqual(self.deliver(issue_event(1)).status_code, 202)
+
+    def test_sha1_signature_of_older_webhooks(self):
+        body = issue_event(1)
+        response = self.deliver(
+            body, HTTP_X_HUB_SIGNATURE_256='', HTTP_X_HUB_SIGNATURE=f'sha1={signature(body, hashlib.sha1)}',
+        )
+        self.assertEqual(response.status_code, 202)
+
+    def test_sha256_signature_is_checked_first(self):
+        body = issue_event(1)
+        response = self.deliver(
+            body, HTTP_X_HUB_SIGNATURE_256=f'sha256={signature(b"")}',
+            HTTP_X_HUB_SIGNATURE=f'sha1={signature(body, hashlib.sha1)}',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_missing_or_invalid_signature(self):
+        body = issue_event(1)
+        for header in ('', 'sha256=', f'sha256={signature(issue_event(2))}', signature(body)[:-1]):
+            with self.subTest(header=header):
+                self.assertEqual(self.deliver(body, HTTP_X_HUB_SIGNATURE_256=header).status_code, 403)
+        self.assertFalse(WebhookDelivery.objects.exists())
+
+    def test_signature_of_the_received_bytes(self):
+        # the JSON GitHub sends keeps non-ASCII text as is, and re-encoding it would change the bytes
+        body = json.dumps(
+            {'action': 'opened', 'issue': dict(issue_payload(1, 1), title='Ajoute le tri à bulles ✨'),
+             'repository': repository_payload()},
+            ensure_ascii=False, indent=2,
+        ).encode()
+        self.assertEqual(self.deliver(body).status_code, 202)
+        self.assertEqual(WebhookDelivery.objects.get().payload['issue']['title'], 'Ajoute le tri à bulles ✨')
+        self.assertEqual(WebhookDelivery.objects.get().payload_hash, hashlib.sha256(body).hexdigest())
+
+
+# the backfill fetches pages in threads, whose ETag cache writes would wait on the SQLite test
+# database, locked by the transaction of the test
+@override_settings(CACHES=dict(settings.CACHES, github={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}))
+class BackfillTests(TestCase):
+
+    def setUp(self):
+        caches['github'].clear()
+        Label.objects.create(name='feature', color='ffffff', points=10)
+        self.checkpoint = os.path.join(isolate_snapshots(self), 'checkpoint.json')
+        pull_requests = [
+            pull_request_payload(11, 1, 'Fixes #1'),
+            pull_request_payload(12, 2, 'Closes #2, fixes #3'),
+            # links issue 5 from the sidebar, and has no description at all
+            pull_request_payload(13, 3, None),
+        ]
+        for pull_request in pull_requests:
+            del pull_request['merged']
+        self.resources = {
+            '/repos/iiitv/leaderboard': repository_payload(),
+            # the issues listing includes pull requests
+            '/repos/iiitv/leaderboard/issues': [issue_payload(id, id % 3 + 1) for id in range(1, 6)] + [
+                dict(issue_payload(11, 1), pull_request={'url': pull_requests[0]['url']}),
+            ],
+            '/repos/iiitv/leaderboard/pulls': pull_requests,
+        }
+        self.links = {'PR_13': [issue_node(5, 3)]}
+
+    def backfill(self, server: FakeGithubServer, **options) -> str:
+        stdout = StringIO()
+        options.setdefault('per_page', 2)
+        call_command(
+            'backfill', 'iiitv/leaderboard', api_url=server.api_url, workers=2,
+            checkpoint=self.checkpoint, stdout=stdout, **options,
+        )
+        return stdout.getvalue()
+
+    def test_backfill(self):
+        with FakeGithubServer(self.links, self.resources) as server:
+            output = self.backfill(server)
+
+        self.assertIn('Backfilled 8 item(s)', output)
+        self.assertIn('items/s', output)
+        self.assertEqual(Issue.objects.count(), 5)
+        self.assertEqual(
+            dict(Issue.objects.values_list('id', 'pr_id')),
+            {1: 11, 2: 12, 3: 12, 4: None, 5: 13},
+        )
+        self.assertEqual(PullRequest.objects.get(id=13).body, '')
+        # only the pull request without closing keywords was looked up
+        self.assertEqual([query['variables'] for query in server.queries], [{'ids': ['PR_13']}])
+        self.assertEqual(
+            dict(ContributorScore.objects.values_list('user_id', 'total')),
+            dict(GithubUser.objects.with_points().values_list('id', 'computed_points')),
+        )
+        # opened issues 1 and 4, and merged pull request 12 closing two issues
+        self.assertEqual(ContributorScore.objects.get(user_id=2).total, 2 * 10 + 2 * 10 + 10)
+
+    def test_resume(self):
+        issues = '/repos/iiitv/leaderboard/issues?state=all&sort=created&direction=asc&per_page=2'
+        pulls = '/repos/iiitv/leaderboard/pulls?state=all&sort=created&direction=asc&per_page=2'
+        with open(self.checkpoint, 'w') as file:
+            json.dump({'iiitv/leaderboard': {'issues': {'2': [1, 2]}, 'pulls': {'2': [1]}}}, file)
+
+        with FakeGithubServer(self.links, self.resources) as server:
+            self.backfill(server)
+        # first pages tell whether the listings grew
+        self.assertEqual(server.requests, [
+            '/repos/iiitv/leaderboard', f'{issues}&page=1', f'{issues}&page=3', f'{pulls}&page=1', f'{pulls}&page=2',
+        ])
+        self.assertEqual(sorted(Issue.objects.values_list('id', flat=True)), [5])
+        self.assertEqual(sorted(PullRequest.objects.values_list('id', flat=True)), [13])
+
+        # only the last page of pull requests is not full
+        with FakeGithubServer(self.links, self.resources) as server:
+            output = self.backfill(server)
+        self.assertEqual(server.requests, [
+            '/repos/iiitv/leaderboard', f'{issues}&page=1', f'{pulls}&page=1', f'{pulls}&page=2',
+        ])
+        self.assertIn('Backfilled 1 item(s)', output)
+
+        with FakeGithubServer(self.links, self.resources) as server:
+            self.backfill(server, restart=True)
+        self.assertEqual(Issue.objects.count(), 5)
+        self.assertEqual(PullRequest.objects.count(), 3)
+
+    def test_pull_requests_opened_since_the_last_run(self):
+        with FakeGithubServer(self.links, self.resources) as server:
+            self.backfill(server)
+        self.resources['/repos/iiitv/leaderboard/pulls'] += [
+            dict(pull_request_payload(id, 1), merged_at=None) for id in (14, 15)
+        ]
+        with FakeGithubServer(self.links, self.resources) as server:
+            output = self.backfill(server)
+        self.assertIn('Backfilled 3 item(s)', output)
+        self.assertEqual(sorted(PullRequest.objects.values_list('id', flat=True)), [11, 12, 13, 14, 15])
+
+    def test_pages_of_another_size(self):
+        with FakeGithubServer(self.links, self.resources) as server:
+            self.backfill(server)
+        PullRequest.objects.all().delete()
+        with FakeGithubServer(self.links, self.resources) as server:
+            self.backfill(server, per_page=3)
+        self.assertEqual(sorted(PullRequest.objects.values_list('id', flat=True)), [11, 12, 13])
+        self.assertIn('/repos/iiitv/leaderboard/issues?state=all&sort=created&direction=asc&per_page=3&page=2',
+                      server.requests)
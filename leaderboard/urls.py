@@ -1,8 +1,24 @@
 from django.urls import path
 
-from .views import GithubWebhookListenerView, ContributorsListView
+from .views import (
+    GithubWebhookListenerView, ContributorsListView, ContributorsSnapshotView, ContributorDetailView,
+    ContributorByUsernameDetailView, RepositoryListView, RepositoryContributorsListView,
+)
 
 urlpatterns = [
     path("webhook/github/", GithubWebhookListenerView.as_view(), name="github_webhook_listener"),
     path("contributors/", ContributorsListView.as_view(), name="contributors_list"),
+    path("contributors/snapshot/", ContributorsSnapshotView.as_view(), name="contributors_snapshot"),
+    path("contributors/<int:pk>/", ContributorDetailView.as_view(), name="contributor_detail"),
+    path(
+        "contributors/by-username/<str:login>/",
+        ContributorByUsernameDetailView.as_view(),
+        name="contributor_detail_by_username",
+    ),
+    path("repositories/", RepositoryListView.as_view(), name="repositories_list"),
+    path(
+        "repositories/<int:pk>/contributors/",
+        RepositoryContributorsListView.as_view(),
+        name="repository_contributors_list",
+    ),
 ]
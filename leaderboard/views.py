@@ -1,96 +1,248 @@
 import hashlib
 import hmac
 import logging
-from typing import Optional
-
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
 from rest_framework import status
 from rest_framework import views, generics
-from rest_framework.exceptions import NotAcceptable
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from .data_models import LabelData, IssueData, RepositoryData, get_data_model, PullRequestData
-from .models import Label, GithubUser
-from .serializers import GithubUserSerializer
-from .utils import GITHUB_WEBHOOK_SECRET, CONTRIBUTION_ACCEPTED_TOPIC
+from .data_models import RepositoryData
+from .fast_serializers import render_contributors
+from .mixins import VersionedCacheMixin, StreamingListMixin
+from .models import DeliveryStatus, GithubUser, Repository, WebhookDelivery
+from .pagination import ContributorCursorPagination
+from .ranking import rank_index
+from .serializers import GithubUserSerializer, GithubUserDetailSerializer, RepositorySerializer
+from .snapshot import snapshot_store, choose_encoding
+from .utils import GITHUB_WEBHOOK_SECRET
+from .webhooks import to_consider, webhook_handler
 
 logger = logging.getLogger(__name__)
 
 
-class ContributorsListView(generics.ListAPIView):
+@extend_schema_view(get=extend_schema(parameters=[
+    OpenApiParameter(
+        'window', str, enum=['day', 'week', 'all'], description='Only count points earned today or this week.',
+    ),
+    OpenApiParameter('from', OpenApiTypes.DATE, description='Only count points earned from this day on.'),
+    OpenApiParameter('to', OpenApiTypes.DATE, description='Only count points earned up to this day.'),
+    OpenApiParameter(
+        'stream', bool,
+        description='Stream the whole list instead of building it in memory, not allowed with limit or cursor.',
+    ),
+    OpenApiParameter(
+        'fields', str,
+        description='Comma separated fields to return, by default id, username, avatar_url and points '
+                    'when expand is given, and all of them otherwise.',
+    ),
+    OpenApiParameter('expand', str, description='Comma separated nested lists to add: issues, pull_requests.'),
+]))
+class ContributorsListView(VersionedCacheMixin, StreamingListMixin, generics.ListAPIView):
     serializer_class = GithubUserSerializer
-    queryset = GithubUser.objects.all()
+    pagination_class = ContributorCursorPagination
+    summary_fields = ('id', 'username', 'avatar_url', 'points')
+    expandable_fields = ('issues', 'pull_requests')
+
+    def get_fields(self) -> Optional[Tuple[str, ...]]:
+        """
+        Fields requested with `fields` and `expand`, `None` meaning all of them.
+        """
+        params = self.request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        fields = [field for field in params.get('fields', '').split(',') if field] or list(self.summary_fields)
+        expand = [field for field in params.get('expand', '').split(',') if field]
+        if not set(expand) <= set(self.expandable_fields):
+            raise ValidationError(f"expand must be among {', '.join(self.expandable_fields)}")
+        if not set(fields) <= set(self.serializer_class.Meta.fields):
+            raise ValidationError(f"fields must be among {', '.join(self.serializer_class.Meta.fields)}")
+        return tuple(fields + [field for field in expand if field not in fields])
+
+    def get_window(self) -> Optional[Tuple[date, date]]:
+        params = self.request.query_params
+        today = timezone.localdate()
+        if 'from' in params or 'to' in params:
+            try:
+                start = date.fromisoformat(params['from']) if 'from' in params else date.min
+                end = date.fromisoformat(params['to']) if 'to' in params else today
+            except ValueError:
+                raise ValidationError('from and to must be dates formatted as YYYY-MM-DD')
+            return start, end
+
+        window = params.get('window', 'all')
+        if window == 'day':
+            return today, today
+        if window == 'week':
+            return today - timedelta(days=today.weekday()), today
+        if window != 'all':
+            raise ValidationError('window must be one of day, week or all')
+        return None
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        # TODO: calculate in query
-        return sorted(queryset, key=lambda x: x.points, reverse=True)
+        fields = self.get_fields()
+        window = self.get_window()
+        if window is None:
+            queryset = GithubUser.objects.scored()
+        else:
+            queryset = GithubUser.objects.ranked_between(*window)
+        # issues and pull requests which are not serialized are not queried either
+        return queryset.with_contributions(
+            *(window or ()),
+            issues=fields is None or 'issues' in fields,
+            pull_requests=fields is None or 'pull_requests' in fields,
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        # the plain JSON list is built by the fast read path, from values rather than model instances
+        if (
+                isinstance(request.accepted_renderer, JSONRenderer)
+                and not self.paginator.is_requested(request)
+                and not self.is_streaming(request)
+        ):
+            queryset = self.filter_queryset(self.get_queryset())
+            return HttpResponse(render_contributors(queryset, self.get_fields()), content_type='application/json')
+        return super().list(request, *args, **kwargs)
 
+    def get_etag_parts(self, request):
+        # windows ending today move at midnight without any webhook
+        return super().get_etag_parts(request) + [str(timezone.localdate())]
 
-class GithubWebhookListenerView(views.APIView):
 
-    @staticmethod
-    def verify_webhook(request: Request) -> bool:
-        signature = request.headers.get('X-Hub-Signature')
-        _, signature = signature.split('=')
-        body = request.raw_body
-        return signature == hmac.new(GITHUB_WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha1).hexdigest()
+class ContributorDetailView(VersionedCacheMixin, generics.RetrieveAPIView):
+    serializer_class = GithubUserDetailSerializer
+    queryset = GithubUser.objects.scored().with_contributions()
 
-    @staticmethod
-    def to_consider(
-            issue: Optional[IssueData] = None,
-            repository: Optional[RepositoryData] = None,
-            label: Optional[LabelData] = None,
-            raise_exception: bool = True,
-    ) -> bool:
-        def _raise():
-            if raise_exception:
-                raise NotAcceptable
-            else:
-                return False
-
-        if issue and not any(
-                label.name in Label.objects.filter(points__gt=0).values_list('name', flat=True)
-                for label in issue.labels
-        ):
-            return _raise()
-        if repository and CONTRIBUTION_ACCEPTED_TOPIC not in repository.topics:
-            return _raise()
-        try:
-            if label and Label.objects.get(name=label.name, points__gt=0):
-                pass
-        except Label.DoesNotExist:
-            return _raise()
+    def get_object(self):
+        user = super().get_object()
+        user.rank = rank_index.rank(user.computed_points)
+        return user
 
-        return True
 
-    def _handle_issues(self, request: Request):
-        issue, repository = get_data_model(request.data, [IssueData, RepositoryData])
-        self.to_consider(repository=repository)
-        issue.to_model()
+class ContributorByUsernameDetailView(ContributorDetailView):
+    lookup_field = 'username'
+    lookup_url_kwarg = 'login'
 
-    def _handle_pull_request(self, request: Request):
-        pull_request, repository = get_data_model(request.data, [PullRequestData, RepositoryData])
-        self.to_consider(repository=repository)
-        pull_request.to_model()
+
+class RepositoryListView(VersionedCacheMixin, generics.ListAPIView):
+    serializer_class = RepositorySerializer
+    queryset = Repository.objects.filter(consider_contributions=True).order_by('name')
+
+
+class RepositoryContributorsListView(VersionedCacheMixin, generics.ListAPIView):
+    serializer_class = GithubUserSerializer
+    pagination_class = ContributorCursorPagination
+
+    def get_queryset(self):
+        repository = get_object_or_404(Repository, pk=self.kwargs['pk'], consider_contributions=True)
+        return GithubUser.objects.ranked_in(repository.pk).with_contributions(repository_id=repository.pk)
+
+
+class ContributorsSnapshotView(View):
+    """
+    Serves the pre-rendered and pre-compressed contributor list straight from the shared snapshot
+    file, without content negotiation, serializers or the ORM.
+    """
+
+    def get(self, request, *args, **kwargs):
+        snapshot = snapshot_store.get()
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), snapshot)
+        etag = f'{snapshot.etag[:-1]}-{encoding}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(snapshot.encoded(encoding), content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class GithubWebhookListenerView(views.APIView):
+
+    # GitHub signs with SHA-256, and still with SHA-1 for older webhooks
+    signature_headers = (('X-Hub-Signature-256', hashlib.sha256), ('X-Hub-Signature', hashlib.sha1))
+
+    @classmethod
+    def verify_webhook(cls, request: Request) -> bool:
+        for header, digest in cls.signature_headers:
+            signature = request.headers.get(header)
+            if signature:
+                _, _, signature = signature.partition('=')
+                expected = hmac.new(GITHUB_WEBHOOK_SECRET.encode(), request.raw_body, digest).hexdigest()
+                return hmac.compare_digest(signature.encode(), expected.encode())
+        return False
+
+    to_consider = staticmethod(to_consider)
 
     def post(self, request: Request, *args, **kwargs):
         if not request.data or not self.verify_webhook(request):
             return Response(status=status.HTTP_403_FORBIDDEN)
 
+        # GitHub redelivers events it thinks timed out, under the same delivery id
+        delivery_id = request.headers.get('X-GitHub-Delivery')
+        payload_hash = hashlib.sha256(request.raw_body).hexdigest()
+        if delivery_id:
+            received_hash = WebhookDelivery.objects.filter(
+                delivery_id=delivery_id,
+            ).values_list('payload_hash', flat=True).first()
+            if received_hash is not None:
+                return self.duplicate(delivery_id, received_hash, payload_hash)
+
         event = request.headers.get('X-GitHub-Event')
         action = request.data.get('action')
 
-        handler = None
-        if action:
-            handler = getattr(self, f"_handle_{event}_{action}", None)
-
-        if not handler:
-            handler = getattr(self, f"_handle_{event}", None)
-
-        if handler:
-            handler(request)
-            return Response(status=status.HTTP_200_OK)
-        else:
+        if event not in webhook_handler.entities or not webhook_handler.get(event, action):
             logger.warning(f"handler for {action} not found")
             return Response(status=status.HTTP_404_NOT_FOUND)
+
+        # applying an event may take long, e.g. linking issues fetches them from GitHub, so it is
+        # left to the `process_webhooks` worker and GitHub gets its answer right away
+        self.to_consider(repository=RepositoryData.from_dict(request.data))
+        try:
+            with transaction.atomic():
+                WebhookDelivery.objects.create(
+                    delivery_id=delivery_id or None,
+                    payload_hash=payload_hash,
+                    event=event,
+                    action=action or '',
+                    entity=webhook_handler.entity(event, request.data),
+                    payload=request.data,
+                )
+        except IntegrityError:
+            # a redelivery received meanwhile
+            received_hash = WebhookDelivery.objects.get(delivery_id=delivery_id).payload_hash
+            return self.duplicate(delivery_id, received_hash, payload_hash)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+    @staticmethod
+    def duplicate(delivery_id: str, received_hash: str, payload_hash: str) -> Response:
+        if received_hash != payload_hash:
+            logger.warning(f"delivery {delivery_id} received again with another payload")
+            return Response(status=status.HTTP_409_CONFLICT)
+        # a redelivery asked for once the delivery ran out of attempts gets it a fresh round of them
+        requeued = WebhookDelivery.objects.filter(delivery_id=delivery_id, status=DeliveryStatus.FAILED).update(
+            status=DeliveryStatus.QUEUED, attempts=0, retry_at=None,
+        )
+        if requeued:
+            logger.info(f"failed delivery {delivery_id} received again, queued it again")
+            return Response(status=status.HTTP_202_ACCEPTED)
+        return Response(status=status.HTTP_200_OK)
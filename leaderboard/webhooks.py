@@ -0,0 +1,199 @@
+import logging
+import time
+import traceback
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import NotAcceptable
+
+from .data_models import IssueData, LabelData, PullRequestData, RepositoryData, get_data_model
+from .labels import label_registry
+from .models import DeliveryStatus, GithubUser, WebhookDelivery
+from .scoring import labelled_contributors, publish_scores, rescore_contributors
+from .utils import CONTRIBUTION_ACCEPTED_TOPIC
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# queued by label writes rather than sent by GitHub, all of them as one entity so that they run one at a time
+RESCORE_EVENT = 'rescore'
+
+
+def to_consider(
+        issue: Optional[IssueData] = None,
+        repository: Optional[RepositoryData] = None,
+        label: Optional[LabelData] = None,
+        raise_exception: bool = True,
+) -> bool:
+    def _raise():
+        if raise_exception:
+            raise NotAcceptable
+        else:
+            return False
+
+    if issue and label_registry.names.isdisjoint(label.name for label in issue.labels):
+        return _raise()
+    if repository and CONTRIBUTION_ACCEPTED_TOPIC not in repository.topics:
+        return _raise()
+    if label and label.name not in label_registry:
+        return _raise()
+
+    return True
+
+
+class WebhookHandler:
+    """
+    Applies the payloads of GitHub events, looking handlers up as `_handle_<event>_<action>` then
+    `_handle_<event>`.
+    """
+    # data model of the entity every event received from GitHub is about
+    entities = {
+        'issues': IssueData,
+        'pull_request': PullRequestData,
+    }
+
+    def get(self, event: str, action: Optional[str]) -> Optional[Callable[[dict], None]]:
+        handler = None
+        if action:
+            handler = getattr(self, f"_handle_{event}_{action}", None)
+        if not handler:
+            handler = getattr(self, f"_handle_{event}", None)
+        return handler
+
+    def entity(self, event: str, data: dict) -> str:
+        key = self.entities[event].key
+        return f"{key}:{data[key]['id']}"
+
+    def _handle_issues(self, data: dict):
+        issue, repository = get_data_model(data, [IssueData, RepositoryData])
+        to_consider(repository=repository)
+        issue.to_model()
+
+    def _handle_pull_request(self, data: dict):
+        pull_request, repository = get_data_model(data, [PullRequestData, RepositoryData])
+        to_consider(repository=repository)
+        pull_request.to_model()
+
+    def _handle_rescore(self, data: dict):
+        if 'labels' in data:
+            users = labelled_contributors(data['labels'])
+        else:
+            users = GithubUser.objects.filter(pk__in=data['users'])
+        report = rescore_contributors(users)
+        logger.info(
+            f'rescored {report.users} contributor(s) in {report.seconds:.3f}s, {report.changed} changed points'
+        )
+
+
+webhook_handler = WebhookHandler()
+
+
+def queue_rescore(**payload) -> WebhookDelivery:
+    """
+    Queues the rescoring of the contributors carrying `labels`, or of the `users` with the given
+    ids, for the `process_webhooks` worker. Called within a label write, the rescoring is queued
+    only if the write commits.
+    """
+    return WebhookDelivery.objects.create(event=RESCORE_EVENT, entity=RESCORE_EVENT, payload=payload)
+
+
+def claim(delivery: WebhookDelivery) -> bool:
+    """
+    Marks a queued delivery as processing, unless another worker got to it first.
+    """
+    return WebhookDelivery.objects.filter(pk=delivery.pk, status=DeliveryStatus.QUEUED).update(
+        status=DeliveryStatus.PROCESSING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    ) == 1
+
+
+def process_delivery(pk: int) -> str:
+    """
+    Applies a claimed delivery and records how it went. Failed deliveries are queued again, after
+    a growing delay, until they ran out of attempts.
+    """
+    delivery = WebhookDelivery.objects.get(pk=pk)
+    try:
+        webhook_handler.get(delivery.event, delivery.action)(delivery.payload)
+    except NotAcceptable:
+        delivery.status = DeliveryStatus.SKIPPED
+    except Exception:
+        logger.exception(f'failed to process webhook delivery {delivery.pk} ({delivery})')
+        delivery.error = traceback.format_exc()
+        if delivery.attempts < MAX_ATTEMPTS:
+            delivery.status = DeliveryStatus.QUEUED
+            delivery.retry_at = timezone.now() + timedelta(seconds=2 ** delivery.attempts)
+        else:
+            delivery.status = DeliveryStatus.FAILED
+    else:
+        delivery.status = DeliveryStatus.DONE
+        publish_scores()
+    finally:
+        delivery.processed_at = timezone.now()
+        delivery.save(update_fields=['status', 'error', 'retry_at', 'processed_at'])
+        close_old_connections()
+    return delivery.status
+
+
+class WebhookWorker:
+    """
+    Feeds queued deliveries to an executor, at most one per entity at a time so that the events of
+    an entity are applied in order, while deliveries of different entities run concurrently.
+    """
+
+    def __init__(self, executor: Executor, workers: int, poll_interval: float = 1.0):
+        self.executor = executor
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.in_flight: Dict[Future, int] = {}
+
+    def dispatch(self) -> int:
+        free = self.workers - len(self.in_flight)
+        if free <= 0:
+            return 0
+        dispatched = 0
+        for delivery in WebhookDelivery.objects.ready().only('pk')[:free]:
+            if claim(delivery):
+                self.in_flight[self.executor.submit(process_delivery, delivery.pk)] = delivery.pk
+                dispatched += 1
+        return dispatched
+
+    def collect(self, timeout: float):
+        done, _ = wait(self.in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            pk = self.in_flight.pop(future)
+            try:
+                future.result()
+            except Exception:
+                # the delivery stays marked as processing until `requeue_stale` gives it back
+                logger.exception(f'worker crashed processing webhook delivery {pk}')
+
+    def run(self, once: bool = False):
+        """
+        Processes deliveries as they are queued, or until the queue is drained when `once` is set.
+        Deliveries waiting for a retry do not keep a drain going.
+        """
+        while True:
+            self.dispatch()
+            if self.in_flight:
+                self.collect(self.poll_interval)
+            elif once:
+                return
+            else:
+                time.sleep(self.poll_interval)
+
+
+def requeue_stale(older_than: timedelta) -> int:
+    """
+    Queues again deliveries left processing by a worker which died, in their original order.
+    """
+    return WebhookDelivery.objects.filter(
+        status=DeliveryStatus.PROCESSING,
+        started_at__lt=timezone.now() - older_than,
+    ).update(status=DeliveryStatus.QUEUED)